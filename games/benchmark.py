@@ -0,0 +1,252 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import time
+import platform
+import argparse
+import multiprocessing
+from pathfinder import Pathfinder, GraphGrid
+from profiler import peak_rss_kb
+from world_generator import WorldGenerator, derive_seed
+
+# World generation and pathfinding benchmarks.
+#
+# Every case runs in a fresh worker process, so the peak RSS it reports
+# belongs to that case alone.  Results are written as JSON :
+#
+#   {'meta':{...},'results':{case name:{metric:value,...},...}}
+#
+# and a later run can be compared against such a file, flagging every
+# case whose throughput fell or latency rose by more than a threshold.
+#
+#   python benchmark.py -o baseline.json
+#   python benchmark.py -o new.json -c baseline.json
+
+default_sizes = (
+                (25,25,3),
+                (60,40,5),
+                (120,120,10),
+                (250,250,10),
+                (500,500,20)
+                )
+quick_sizes = ((25,25,3),(60,40,5))
+
+# Pathfinder algorithms, by their Pathfinder attribute name
+algorithms = ('a_star','b_first','gb_first','jps')
+
+# Metrics where a larger value is better; for the rest smaller is
+larger_better = ('worlds_per_s','tiles_per_s','searches_per_s')
+
+def percentile(values,pct):
+    """ Nearest-rank percentile of values """
+    ordered = sorted(values)
+    rank = int(round(pct/100.0*(len(ordered)-1)))
+    return ordered[rank]
+
+def latency_stats(times):
+    return {
+        'min':min(times),
+        'p50':percentile(times,50),
+        'p90':percentile(times,90),
+        'p99':percentile(times,99),
+        'max':max(times)
+        }
+
+def world_case(job):
+    """ Generates repeat worlds of one size and layout, returns stats """
+    dims,layout,repeat,seed = job
+    dim_x,dim_y,dim_z = dims
+
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        WorldGenerator(
+                    silent=True,
+                    seed=derive_seed(seed,i),
+                    dim_x=dim_x,dim_y=dim_y,dim_z=dim_z,
+                    layout=layout
+                    )
+        times.append(time.time()-start)
+
+    total = sum(times)
+    tiles = dim_x*dim_y*(dim_z+1)
+    result = {
+            'worlds':repeat,
+            'worlds_per_s':repeat/total,
+            'tiles_per_s':repeat*tiles/total,
+            'peak_rss_kb':peak_rss_kb()
+            }
+    result.update(latency_stats(times))
+    return result
+
+def path_case(job):
+    """ Times one Pathfinder algorithm across a world's floors """
+    dims,name,repeat,seed = job
+    dim_x,dim_y,dim_z = dims
+    alg = getattr(Pathfinder,name)
+
+    world = WorldGenerator(
+                        silent=True,seed=seed,
+                        dim_x=dim_x,dim_y=dim_y,dim_z=dim_z
+                        )
+
+    times = []
+    for z in range(dim_z+1):
+        graph = GraphGrid.from_world(world.grid,z)
+        start,end = world.find_path_ends(z)
+
+        for i in range(repeat):
+            finder = Pathfinder(alg)
+            finder.g = graph
+            finder.start = start[:2]
+            finder.dest = end[:2]
+            t = time.time()
+            finder.execute()
+            times.append(time.time()-t)
+
+    result = {
+            'searches':len(times),
+            'searches_per_s':len(times)/sum(times),
+            'peak_rss_kb':peak_rss_kb()
+            }
+    result.update(latency_stats(times))
+    return result
+
+def run_case(args):
+    """ Pool entry point, returns (name,result or error) """
+    name,func,job = args
+    try:
+        return name,func(job)
+    except Exception as e:
+        return name,{'error':'{}: {}'.format(type(e).__name__,e)}
+
+def case_list(sizes,layouts,algs,repeat,seed):
+    """ Returns the (name,function,job) of every benchmark case """
+    cases = []
+    for dims in sizes:
+        size = '{}x{}x{}'.format(*dims)
+        for layout in layouts:
+            cases.append((
+                        'world/{}/{}'.format(layout,size),
+                        world_case,
+                        (dims,layout,repeat,seed)
+                        ))
+        for name in algs:
+            cases.append((
+                        'path/{}/{}'.format(name,size),
+                        path_case,
+                        (dims,name,repeat,seed)
+                        ))
+    return cases
+
+def run(cases,out=None):
+    """ Runs cases one per fresh process, returns the results dict """
+    results = {}
+    pool = multiprocessing.Pool(1,maxtasksperchild=1)
+    try:
+        for name,result in pool.imap(run_case,cases):
+            results[name] = result
+            if out is not None:
+                out.write('{:<32} {}\n'.format(name,summary(result)))
+                out.flush()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
+
+def summary(result):
+    if 'error' in result:
+        return 'ERROR {}'.format(result['error'])
+    rate = [k for k in larger_better if k in result][0]
+    return '{:>12.2f} {}  p50 {:.4f}s  p99 {:.4f}s  rss {} KB'.format(
+                                                        result[rate],rate,
+                                                        result['p50'],
+                                                        result['p99'],
+                                                        result['peak_rss_kb']
+                                                        )
+
+def compare(results,baseline,threshold=0.1):
+    """ Returns [(case,metric,old,new)] for each regression over threshold
+
+    Throughput must not drop, and p50/p90 latency must not rise, by
+    more than threshold (a fraction) relative to baseline.
+    """
+    regressions = []
+    for name in sorted(results):
+        old = baseline.get(name)
+        new = results[name]
+        if old is None or 'error' in old or 'error' in new:
+            continue
+        for metric in larger_better+('p50','p90'):
+            if metric not in old or metric not in new or not old[metric]:
+                continue
+            change = (new[metric]-old[metric])/float(old[metric])
+            if metric in larger_better:
+                change = -change
+            if change>threshold:
+                regressions.append((name,metric,old[metric],new[metric]))
+    return regressions
+
+def meta():
+    return {
+        'date':time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python':platform.python_version(),
+        'platform':platform.platform(),
+        'cpus':multiprocessing.cpu_count()
+        }
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(
+                description='Benchmark world generation and pathfinding'
+                )
+    parser.add_argument('-o','--output',default='benchmark.json',
+                        help='results file (default benchmark.json)')
+    parser.add_argument('-c','--compare',default=None,
+                        help='baseline results file to check against')
+    parser.add_argument('-t','--threshold',default=0.1,type=float,
+                        help='regression threshold fraction (default 0.1)')
+    parser.add_argument('-r','--repeat',default=3,type=int,
+                        help='worlds or searches per case (default 3)')
+    parser.add_argument('-S','--seed',default=0,type=int,help='base seed')
+    parser.add_argument('-q','--quick',action='store_true',
+                        help='small sizes only')
+    parser.add_argument('-l','--layouts',default=None,
+                        help='comma separated layouts (default all)')
+    args = parser.parse_args()
+
+    sizes = quick_sizes if args.quick else default_sizes
+    layouts = WorldGenerator.layouts
+    if args.layouts:
+        layouts = args.layouts.split(',')
+        for layout in layouts:
+            if layout not in WorldGenerator.layouts:
+                parser.error('invalid layout : {}'.format(layout))
+
+    results = run(
+                case_list(sizes,layouts,algorithms,args.repeat,args.seed),
+                sys.stdout
+                )
+
+    with open(args.output,'w') as outfile:
+        json.dump(
+                {'meta':meta(),'results':results},
+                outfile,indent=2,sort_keys=True
+                )
+    print 'Wrote {}'.format(args.output)
+
+    if args.compare:
+        with open(args.compare) as infile:
+            baseline = json.load(infile)['results']
+        regressions = compare(results,baseline,args.threshold)
+        for name,metric,old,new in regressions:
+            print 'REGRESSION {} {} : {:.4g} -> {:.4g}'.format(
+                                                        name,metric,old,new
+                                                        )
+        if regressions:
+            sys.exit(1)
+        print 'No regressions over {:.0%}'.format(args.threshold)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+# Binary space partition floor layout.  The floor is split in two,
+# along its longer side, until the parts are too small to split again.
+# Every leaf gets one room, kept a tile inside the leaf so rooms never
+# touch or overlap.  Each split then links one room from either side,
+# so the links form a tree over the rooms and each corridor stays
+# inside the part that was split.
+#
+# Every split and leaf is visited once : the work is linear in the
+# number of rooms, independent of the floor area.
+
+def partition(dim_x,dim_y,rng,min_leaf=6):
+    """ Lays out rooms on a dim_x by dim_y floor
+
+    Returns (rooms,links) : rooms as (x0,y0,x1,y1) inclusive boxes,
+    links as pairs of room centers (x,y) to join with corridors.
+    """
+    rooms = []
+    links = []
+    split(0,0,dim_x-1,dim_y-1,rng,min_leaf,rooms,links)
+    return rooms,links
+
+def split(x0,y0,x1,y1,rng,min_leaf,rooms,links):
+    """ Partitions the box x0,y0..x1,y1, returns a room center in it """
+    w = x1-x0+1
+    h = y1-y0+1
+
+    can_x = w>=2*min_leaf
+    can_y = h>=2*min_leaf
+    if not (can_x or can_y):
+        return place_room(x0,y0,x1,y1,rng,rooms)
+
+    # Split across the longer side, or at random when close to square
+    if can_x and can_y:
+        if w>h*1.25:
+            vertical = True
+        elif h>w*1.25:
+            vertical = False
+        else:
+            vertical = rng.random()<0.5
+    else:
+        vertical = can_x
+
+    if vertical:
+        cut = rng.randint(x0+min_leaf,x1-min_leaf+1)
+        a = split(x0,y0,cut-1,y1,rng,min_leaf,rooms,links)
+        b = split(cut,y0,x1,y1,rng,min_leaf,rooms,links)
+    else:
+        cut = rng.randint(y0+min_leaf,y1-min_leaf+1)
+        a = split(x0,y0,x1,cut-1,rng,min_leaf,rooms,links)
+        b = split(x0,cut,x1,y1,rng,min_leaf,rooms,links)
+
+    if a is None or b is None:
+        return a if b is None else b
+    links.append((a,b))
+    return a if rng.random()<0.5 else b
+
+def place_room(x0,y0,x1,y1,rng,rooms):
+    """ Adds a room inside the leaf box, returns its center or None """
+    # A one tile margin of wall separates neighboring rooms
+    avail_x = x1-x0-1
+    avail_y = y1-y0-1
+    if avail_x<1 or avail_y<1:
+        return None
+
+    w = rng.randint(max(1,avail_x//2),avail_x)
+    h = rng.randint(max(1,avail_y//2),avail_y)
+    rx = rng.randint(x0+1,x1-w)
+    ry = rng.randint(y0+1,y1-h)
+
+    room = (rx,ry,rx+w-1,ry+h-1)
+    rooms.append(room)
+    return room_center(room)
+
+def room_center(room):
+    x0,y0,x1,y1 = room
+    return ((x0+x1)//2,(y0+y1)//2)
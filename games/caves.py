@@ -0,0 +1,80 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+import string
+
+# Cellular-automata cave floors.
+#
+# A floor is held as one Python integer with a bit per tile (1 = wall),
+# rows dim_x+1 bits wide : the extra column, a row above and below the
+# floor and one leading bit (the column left of the top row) are
+# padding walls, so the edges behave as solid rock and shifted rows
+# never wrap into each other.  The 8 neighbors of every tile are the
+# floor shifted by 1, W, W-1 and W+1 bits either way, and they are
+# counted for the whole floor at once by a bit-sliced adder, so each
+# smoothing step is a few dozen big-integer operations rather than a
+# loop over tiles.
+#
+# Smoothing rule : a tile becomes wall with 5 or more wall neighbors,
+# and stays wall with 4 or more.
+
+def cave_floor(dim_x,dim_y,rng,wall,space,fill=7,steps=4):
+    """ Returns a cave floor as a string of dim_x*dim_y tiles
+
+    wall and space are the tile values written for rock and open cave,
+    rng a random.Random.  fill/16 is the initial wall density, steps
+    the number of smoothing passes.
+    """
+    width = dim_x+1
+    size = width*(dim_y+2)+1
+    full = (1<<size)-1
+    pad = padding(dim_x,dim_y)
+
+    cells = random_bits(rng,size,fill)|pad
+    for step in range(steps):
+        cells = smooth(cells,width,full)|pad
+
+    # Bit i of the integer is character i of the reversed binary string
+    bits = format(cells,'b').zfill(size)[::-1]
+    rows = [bits[y*width+1:y*width+1+dim_x] for y in range(1,dim_y+1)]
+    return ''.join(rows).translate(string.maketrans('01',space+wall))
+
+def padding(dim_x,dim_y):
+    """ Returns the bits of the padding column and rows """
+    width = dim_x+1
+    rows = dim_y+2
+    row = (1<<width)-1
+    # One bit per row at column dim_x : dim_x shifted repunit in base 2**W
+    column = (1<<dim_x)*(((1<<(width*rows))-1)//row)
+    return ((column|row|(row<<(width*(rows-1))))<<1)|1
+
+def random_bits(rng,size,fill):
+    """ Returns size random bits, each set with probability fill/16 """
+    # Each tile draws a 4 bit number (one bit from each of 4 random
+    # integers), set when the number is below fill
+    below = 0
+    equal = (1<<size)-1
+    for i in (3,2,1,0):
+        plane = rng.getrandbits(size)
+        if (fill>>i)&1:
+            below |= equal&~plane
+            equal &= plane
+        else:
+            equal &= ~plane
+    return below
+
+def smooth(cells,width,full):
+    """ Applies one smoothing step to the whole floor """
+    counts = [0,0,0,0]     # Bit-sliced neighbor counts, low bit first
+    for shift in (1,width-1,width,width+1):
+        for bits in (cells<<shift,cells>>shift):
+            carry = bits
+            for i in range(4):
+                counts[i],carry = counts[i]^carry,counts[i]&carry
+                if not carry:
+                    break
+
+    c0,c1,c2,c3 = counts
+    five_up = c3|(c2&(c1|c0))
+    four_up = c3|c2
+    return (five_up|(cells&four_up))&full
@@ -0,0 +1,114 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+from array import array
+from tiles import WorldTile
+
+# Tiles nothing can walk through : walls and locked doors
+default_impassable = (WorldTile.wall,'L')
+
+class FloorLabels(object):
+
+    """ Connected components of one floor, labeled in a single pass """
+
+    # Each row is split into runs of passable tiles with
+    # bytearray.translate() and find(), so the work is per run rather
+    # than per tile.  Runs are joined to the overlapping runs of the row
+    # above with a union-find, then every run is written into a flat
+    # label array with one slice assignment.  Impassable tiles are 0.
+    #
+    # After labeling, "which component holds (x,y)" is an array lookup.
+    #
+    # With passable given, only those tiles are labeled and impassable
+    # is ignored, e.g. passable=(WorldTile.dungeon,) labels the rooms.
+
+    def __init__(self,grid,z,impassable=default_impassable,passable=None):
+        self.dim_x = grid.dim_x
+        self.dim_y = grid.dim_y
+        self.z = z
+
+        if passable is None:
+            table = bytearray('\x01'*256)
+            for tile in impassable:
+                table[ord(tile)] = 0
+        else:
+            table = bytearray(256)
+            for tile in passable:
+                table[ord(tile)] = 1
+
+        parent = [0]    # union-find over run ids, 0 = impassable
+        runs = []       # (run id,y,start,end) of every run
+        prev = []       # (run id,y,start,end) of the previous row
+
+        for y in range(self.dim_y):
+            start = grid.offset((0,y,z))
+            row = grid.tiles[start:start+self.dim_x].translate(table)
+
+            this = []
+            i = row.find('\x01')
+            while i!=-1:
+                end = row.find('\x00',i)
+                if end==-1:
+                    end = self.dim_x
+                run = len(parent)
+                parent.append(run)
+                this.append((run,y,i,end))
+                i = row.find('\x01',end)
+
+            # Join runs sharing a column with a run in the row above
+            j = 0
+            for run,ry,a,b in this:
+                while j<len(prev) and prev[j][3]<=a:
+                    j += 1
+                k = j
+                while k<len(prev) and prev[k][2]<b:
+                    union(parent,run,prev[k][0])
+                    k += 1
+
+            runs.extend(this)
+            prev = this
+
+        # Compact the roots to labels 1..n and fill the label array
+        roots = {}
+        self.labels = array('i',[0])*(self.dim_x*self.dim_y)
+        self.runs = []      # (label,y,start,end) of every run
+        for run,y,a,b in runs:
+            label = roots.setdefault(find(parent,run),len(roots)+1)
+            offset = y*self.dim_x
+            self.labels[offset+a:offset+b] = array('i',[label])*(b-a)
+            self.runs.append((label,y,a,b))
+
+        self.count = len(roots)
+
+    def label(self,pt):
+        """ Returns the component label of (x,y[,z]), 0 if impassable """
+        x,y = pt[0],pt[1]
+        if 0<=x<self.dim_x and 0<=y<self.dim_y:
+            return self.labels[y*self.dim_x+x]
+        return 0
+
+    def connected(self,pt1,pt2):
+        """ True if both points are passable and in one component """
+        a = self.label(pt1)
+        return a!=0 and a==self.label(pt2)
+
+    def disconnected(self,points):
+        """ Returns the points not in the first point's component """
+        points = list(points)
+        if not points:
+            return []
+        first = self.label(points[0])
+        return [pt for pt in points if first==0 or self.label(pt)!=first]
+
+def find(parent,i):
+    """ Union-find root lookup with path halving """
+    while parent[i]!=i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def union(parent,a,b):
+    ra = find(parent,a)
+    rb = find(parent,b)
+    if ra!=rb:
+        parent[max(ra,rb)] = min(ra,rb)
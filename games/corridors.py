@@ -0,0 +1,105 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+# Corridor carving helpers.  A corridor between two points on a floor is
+# a monotone staircase : every step moves toward the goal along x or y,
+# so it is always a shortest 4-connected path and takes exactly
+# |dx|+|dy| steps.  Randomness only decides where the corridor bends.
+
+def corridor(start,goal,rng,jitter=0.3):
+    """ Returns the tiles of a corridor from start to goal
+
+    start and goal are (x,y,z) on the same floor, rng a random.Random.
+    jitter (0..1) is the chance of re-picking the axis after each step :
+    0 gives a single bend, 1 a ragged staircase.  The start tile is not
+    included, the goal tile is.
+    """
+    x,y,z = start
+    gx,gy = goal[0],goal[1]
+    tiles = []
+
+    axis = pick_axis(gx-x,gy-y,rng)
+    while (x,y)!=(gx,gy):
+        dx = gx-x
+        dy = gy-y
+
+        # Switch axis when this one is done, or at random by jitter
+        if (axis==0 and dx==0) or (axis==1 and dy==0):
+            axis = 1-axis
+        elif jitter and rng.random()<jitter:
+            axis = pick_axis(dx,dy,rng)
+
+        if axis==0:
+            x += 1 if dx>0 else -1
+        else:
+            y += 1 if dy>0 else -1
+        tiles.append((x,y,z))
+
+    return tiles
+
+def pick_axis(dx,dy,rng):
+    """ Picks x (0) or y (1), weighted by the distance left on each """
+    total = abs(dx)+abs(dy)
+    if total==0:
+        return 0
+    return 0 if rng.random()*total<abs(dx) else 1
+
+def manhattan(pt1,pt2):
+    return abs(pt1[0]-pt2[0])+abs(pt1[1]-pt2[1])
+
+def link_plan(points,rng=None,loops=0.0):
+    """ Returns the (i,j) index pairs of points to join with corridors
+
+    The pairs form a minimum spanning tree over corridor length (the
+    Manhattan distance), so every point is linked and no corridor
+    crosses the floor for nothing.  With loops (0..1) and rng, each
+    point also gets a link to its nearest non-neighbor in the tree with
+    that probability, adding cycles.  Tree edges come first, in the
+    order they were added.
+    """
+    n = len(points)
+    if n<2:
+        return []
+
+    # Prim's algorithm on the complete graph, O(n^2)
+    in_tree = [False]*n
+    best = [None]*n         # Cheapest known link into the tree
+    parent = [None]*n
+    in_tree[0] = True
+    for i in range(1,n):
+        best[i] = manhattan(points[0],points[i])
+        parent[i] = 0
+
+    edges = []
+    linked = set()
+    for step in range(n-1):
+        j = min(
+                (i for i in range(n) if not in_tree[i]),
+                key=lambda i: best[i]
+                )
+        in_tree[j] = True
+        edges.append((parent[j],j))
+        linked.add((min(parent[j],j),max(parent[j],j)))
+
+        for i in range(n):
+            if not in_tree[i]:
+                dist = manhattan(points[j],points[i])
+                if dist<best[i]:
+                    best[i] = dist
+                    parent[i] = j
+
+    if loops and rng is not None and n>2:
+        for i in range(n):
+            if rng.random()>=loops:
+                continue
+            others = [
+                    j for j in range(n)
+                    if j!=i and (min(i,j),max(i,j)) not in linked
+                    ]
+            if not others:
+                continue
+            j = min(others,key=lambda j: manhattan(points[i],points[j]))
+            edges.append((i,j))
+            linked.add((min(i,j),max(i,j)))
+
+    return edges
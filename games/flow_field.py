@@ -0,0 +1,156 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+import collections
+from array import array
+
+# Raw distance of a cell no goal can reach
+unreached = 1<<30
+
+class FlowField(object):
+
+    """ Distance to the nearest goal and the step toward it, per cell """
+
+    # One multi-source breadth first search from the goals over a
+    # GraphGrid's passability bitmap fills two arrays indexed like the
+    # bitmap : the distance to the nearest goal and the neighbor cell
+    # one step closer.  Every move costs 1, so breadth first search
+    # gives the same field Dijkstra would.  Any number of agents then
+    # read their next step in O(1).
+    #
+    # Distances are kept as raw+base.  When a goal moves one tile no
+    # cell gets more than 1 farther from the goals, so move_goal()
+    # bumps base, moving every cell 1 farther for free, and then
+    # searches out from the goals only through cells that came closer.
+    # Cells that didn't come closer are exactly 1 farther and their old
+    # step still leads to a goal.  The cost per move is the number of
+    # cells that came closer, not the size of the floor.
+    #
+    # A change in the graph's passability (its version) needs a full
+    # rebuild, see update().
+
+    def __init__(self,graph,goals):
+        assert graph.cells is not None, 'Not assigned! FlowField graph'
+        self.graph = graph
+        self.goals = [tuple(pt) for pt in goals]
+        self.raw = None         # Distance-base by cell, unreached if none
+        self.step = None        # Next cell toward a goal by cell, or -1
+        self.base = 0
+        self.version = None     # Graph version the field was built for
+        self.build()
+
+    def build(self):
+        """ Recomputes the whole field from the goals """
+        graph = self.graph
+        n = len(graph.cells)
+        self.raw = array('i',[unreached])*n
+        self.step = array('i',[-1])*n
+        self.base = 0
+        self.version = getattr(graph,'version',0)
+
+        sources = []
+        for pt in self.goals:
+            if not graph.in_bounds(pt):
+                continue
+            i = graph.index(pt)
+            if graph.cells[i] and self.raw[i]==unreached:
+                self.raw[i] = 0
+                sources.append(i)
+        return self.spread(sources)
+
+    def spread(self,sources):
+        """ Breadth first search from sources through cells that improve
+
+        Returns the number of cells updated.
+        """
+        cells = self.graph.cells
+        offsets = self.graph.offsets
+        raw = self.raw
+        step = self.step
+
+        frontier = collections.deque(sources)
+        touched = len(sources)
+        while frontier:
+            i = frontier.popleft()
+            d = raw[i]+1
+            for o in offsets:
+                j = i+o
+                if cells[j] and d<raw[j]:
+                    raw[j] = d
+                    step[j] = i
+                    frontier.append(j)
+                    touched += 1
+        return touched
+
+    def update(self):
+        """ Rebuilds the field if the graph's passability changed
+
+        Returns True if it was rebuilt.
+        """
+        if getattr(self.graph,'version',0)!=self.version:
+            self.build()
+            return True
+        return False
+
+    def set_goals(self,goals):
+        self.goals = [tuple(pt) for pt in goals]
+        self.build()
+
+    def move_goal(self,old,new):
+        """ Moves goal old to new, updating the field
+
+        Moves of one tile onto an open cell update incrementally, any
+        other move rebuilds.  Returns the number of cells updated.
+        """
+        graph = self.graph
+        old = tuple(old)
+        new = tuple(new)
+        self.goals[self.goals.index(old)] = new
+
+        adjacent = abs(old[0]-new[0])+abs(old[1]-new[1])==1
+        if (
+            getattr(graph,'version',0)!=self.version or not adjacent or
+            not graph.in_bounds(new) or not graph.passable(new)
+            ):
+            return self.build()
+
+        # Every cell 1 farther, then reseed the goals at 0
+        self.base += 1
+        raw = self.raw
+        sources = []
+        for pt in self.goals:
+            if not graph.in_bounds(pt):
+                continue
+            i = graph.index(pt)
+            if graph.cells[i] and raw[i]!=-self.base:
+                raw[i] = -self.base
+                self.step[i] = -1
+                sources.append(i)
+
+        # The old goal is now 1 from the new one, unless still a goal
+        i = graph.index(old)
+        if old not in self.goals and raw[i]+self.base==1:
+            self.step[i] = graph.index(new)
+
+        return self.spread(sources)
+
+    def distance(self,pt):
+        """ Steps from pt to the nearest goal, None if unreachable """
+        if not self.graph.in_bounds(pt):
+            return None
+        d = self.raw[self.graph.index(pt)]
+        if d>=unreached:
+            return None
+        return d+self.base
+
+    def next_step(self,pt):
+        """ Returns the point one step closer to a goal
+
+        None at a goal or where no goal can be reached.
+        """
+        if not self.graph.in_bounds(pt):
+            return None
+        i = self.step[self.graph.index(pt)]
+        if i<0:
+            return None
+        return self.graph.point(i)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+import sys
+import mmap
+import struct
+import argparse
+from tiles import WorldTile
+from world_grid import WorldGrid
+
+# Binary map file layout (little-endian) :
+#
+#   header  : magic, version, flags, dim_x, dim_y, floors,
+#             point count, tile data offset
+#   points  : (tile code, x, y, z) for each special point
+#   tiles   : floors*dim_y*dim_x tile codes, floor by floor, row by row
+#
+# Tile codes are the same single characters map_template holds, so a
+# floor is readable straight out of the mapped file with no parsing.
+
+MAGIC = 'PWMF'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHHIIIII')
+POINT = struct.Struct('<cIII')
+
+class MapFormatError(Exception):
+    pass
+
+def write_map(grid,fpath,floors=None):
+    """ Writes a WorldGrid to fpath in the binary map format """
+
+    if floors is None:
+        floors = grid.floors
+
+    # File floors count from 0, whatever base_z the grid holds
+    points = []
+    for z in range(floors):
+        for tile_type in WorldTile.stairs:
+            for x,y in grid.positions(grid.base_z+z,tile_type):
+                points.append((tile_type,x,y,z))
+
+    # Row-major order, as a scan of the tiles finds them
+    points.sort(key=lambda pt:(pt[3],pt[2],pt[1]))
+
+    with open(fpath,'wb') as outfile:
+        write_header(outfile,grid.dim_x,grid.dim_y,floors,points)
+        for z in range(floors):
+            start = z*grid.floor_size
+            outfile.write(buffer(grid.tiles,start,grid.floor_size))
+
+def write_header(outfile,dim_x,dim_y,floors,points):
+    data_offset = HEADER.size+POINT.size*len(points)
+    outfile.write(HEADER.pack(
+                            MAGIC,VERSION,0,
+                            dim_x,dim_y,floors,
+                            len(points),data_offset
+                            ))
+    for point in points:
+        outfile.write(POINT.pack(*point))
+
+class MapFile(object):
+
+    """ Read-only, memory-mapped view of a binary map file """
+
+    def __init__(self,fpath):
+        self.fpath = fpath
+        self.infile = open(fpath,'rb')
+        try:
+            self.mm = mmap.mmap(self.infile.fileno(),0,access=mmap.ACCESS_READ)
+        except:
+            self.infile.close()
+            raise
+
+        if len(self.mm)<HEADER.size:
+            self.close()
+            raise MapFormatError('Truncated map file : {}'.format(fpath))
+
+        (magic,version,flags,self.dim_x,self.dim_y,self.floors,
+            count,self.data_offset) = HEADER.unpack_from(self.mm,0)
+
+        if magic!=MAGIC:
+            self.close()
+            raise MapFormatError('Not a map file : {}'.format(fpath))
+        if version!=VERSION:
+            self.close()
+            raise MapFormatError('Unsupported map version {} : {}'.format(
+                                                                    version,
+                                                                    fpath
+                                                                    ))
+
+        self.flags = flags
+        self.floor_size = self.dim_x*self.dim_y
+        self.dims = (self.dim_x,self.dim_y,self.floors)
+
+        self.points = [
+                    POINT.unpack_from(self.mm,HEADER.size+POINT.size*i)
+                    for i in range(count)
+                    ]
+
+        if len(self.mm)<self.data_offset+self.floor_size*self.floors:
+            self.close()
+            raise MapFormatError('Truncated map file : {}'.format(fpath))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def close(self):
+        self.mm.close()
+        self.infile.close()
+
+    def offset(self,key):
+        x,y,z = key
+        if 0<=x<self.dim_x and 0<=y<self.dim_y and 0<=z<self.floors:
+            return self.data_offset+(z*self.dim_y+y)*self.dim_x+x
+        raise KeyError(key)
+
+    def __getitem__(self,key):
+        return self.mm[self.offset(key)]
+
+    def floor(self,z):
+        """ Returns floor z as a zero-copy buffer over the mapped file """
+        return buffer(self.mm,self.offset((0,0,z)),self.floor_size)
+
+    def row(self,y,z):
+        """ Returns one row as a zero-copy buffer over the mapped file """
+        return buffer(self.mm,self.offset((0,y,z)),self.dim_x)
+
+    def locate(self,z,tile_type):
+        """ Returns the first (x,y,z) of tile_type on floor z, or False """
+        for tile,x,y,pz in self.points:
+            if pz==z and tile==tile_type:
+                return (x,y,z)
+        return False
+
+    def to_grid(self):
+        """ Copies the map into a WorldGrid """
+        grid = WorldGrid(self.dim_x,self.dim_y,self.floors,WorldTile.wall)
+        grid.tiles[:] = self.mm[self.data_offset:
+                                self.data_offset+len(grid.tiles)]
+        for tile_type in WorldTile.stairs:
+            grid.index_tile(tile_type)
+        return grid
+
+def iter_template(infile,chunk_size=65536):
+    """ Yields (z,y,row) from map_template source, without exec'ing it
+
+    The source is read in chunks, so only one row is held at a time.
+    """
+    depth = 0
+    z = y = 0
+    row = []
+    token = []
+
+    while True:
+        chunk = infile.read(chunk_size)
+        if not chunk:
+            break
+        for ch in chunk:
+            if ch=='(':
+                depth += 1
+            elif ch==')':
+                if depth==3:
+                    if token:
+                        row.append(''.join(token))
+                        token = []
+                    yield z,y,row
+                    row = []
+                    y += 1
+                elif depth==2:
+                    z += 1
+                    y = 0
+                depth -= 1
+            elif depth==3:
+                if ch==',':
+                    row.append(''.join(token))
+                    token = []
+                elif not ch.isspace() and ch not in '\'"':
+                    token.append(ch)
+
+    if depth!=0:
+        raise MapFormatError('Unbalanced map_template source')
+
+def convert_template(src,dst):
+    """ Converts a map_template python file to the binary map format """
+
+    # First pass finds the dimensions and special points, the second
+    # streams the rows out behind the header
+    dim_x = dim_y = floors = 0
+    points = []
+    with open(src,'r') as infile:
+        for z,y,row in iter_template(infile):
+            if dim_x==0:
+                dim_x = len(row)
+            elif len(row)!=dim_x:
+                raise MapFormatError('Ragged row {} on floor {}'.format(y,z))
+            dim_y = max(dim_y,y+1)
+            floors = z+1
+            for x,tile in enumerate(row):
+                if tile in WorldTile.stairs:
+                    points.append((tile,x,y,z))
+
+    with open(src,'r') as infile:
+        with open(dst,'wb') as outfile:
+            write_header(outfile,dim_x,dim_y,floors,points)
+            written = 0
+            for z,y,row in iter_template(infile):
+                for tile in row:
+                    if len(tile)!=1:
+                        raise MapFormatError('Invalid tile {!r} at {}'.format(
+                                                                tile,
+                                                                (y,z)
+                                                                ))
+                outfile.write(''.join(row))
+                written += 1
+
+    if written!=dim_y*floors:
+        raise MapFormatError('Floors have differing row counts')
+
+    return dim_x,dim_y,floors
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(
+                description='Convert map_template files to binary maps'
+                )
+    parser.add_argument('src',help='map_template python file')
+    parser.add_argument('dst',help='binary map output file')
+    args = parser.parse_args()
+
+    try:
+        dims = convert_template(args.src,args.dst)
+    except (IOError,MapFormatError) as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(1)
+
+    print 'Wrote {} : {}x{}, {} floors'.format(args.dst,*dims)
@@ -3,6 +3,7 @@
 
 import collections
 import heapq
+from array import array
 
 class Queue:
     """ Basic queue implementation using collections.deque() """
@@ -35,21 +36,68 @@ class PriorityQueue:
     def get(self):
         return heapq.heappop(self.elements)[1]
 
+class PathCache(object):
+
+    """ Bounded least recently used cache of paths """
+
+    def __init__(self,size=256):
+        self.size = size
+        self.paths = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.paths)
+
+    def get(self,key):
+        """ Returns the path cached under key, KeyError if missing """
+        try:
+            path = self.paths.pop(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.paths[key] = path      # Most recently used goes last
+        self.hits += 1
+        return path
+
+    def put(self,key,path):
+        self.paths.pop(key,None)
+        self.paths[key] = path
+        while len(self.paths)>self.size:
+            self.paths.popitem(last=False)
+
+    def clear(self):
+        self.paths.clear()
+
 class Pathfinder:
 
     """ Performs basic pathfinding operations """
 
+    # Searches on a GraphGrid run on its flat passability bitmap (see
+    # grid_search); other graphs only need neighbor() and cost() and
+    # are searched node by node.  Either way the results are the same
+    # dicts keyed by (x,y).
+    #
+    # find_path() returns whole paths and remembers the last cache_size
+    # of them, keyed by (graph version,algorithm,start,goal).  A
+    # GraphGrid bumps its version whenever passability changes, so a
+    # locked door never serves a stale path; graphs without a version
+    # are assumed never to change.
+
     a_star = 0      # A* algorithm (default)
     b_first = 1     # Breadth first
     gb_first = 2    # Greedy best-first
+    jps = 3         # Jump point search, GraphGrid only
 
-    def __init__(self,alg=0):
+    def __init__(self,alg=0,cache_size=256):
         self.early_exit = True
         self.impediments = []
         self.alg = alg
         self.g = None
         self.start = None
         self.dest = None
+        self.cache = PathCache(cache_size)
+        self.cache_graph = None     # The graph the cached paths belong to
 
     def execute(self):
 
@@ -57,19 +105,94 @@ class Pathfinder:
         assert self.start is not None, 'Start point not specified!'
         assert self.dest is not None, 'End point not specified!'
 
-        if self.alg==Pathfinder.a_star:
+        # The a_star method shadows its constant, accept either
+        if self.alg==0 or self.alg==Pathfinder.a_star:
             results = self.a_star(self.g,self.start,self.dest)
         elif self.alg==Pathfinder.b_first:
             results = self.bf_search(self.g,self.start,self.dest)
         elif self.alg==Pathfinder.gb_first:
             results = self.gbf_search(self.g,self.start,self.dest)
+        elif self.alg==Pathfinder.jps:
+            results = self.jps_search(self.g,self.start,self.dest)
         else:
             results = False
 
         return results
 
+    def find_path(self,start,goal):
+        """ Returns the path from start to goal as a tuple of points
+
+        The path includes both ends, and is None if goal is unreachable.
+        """
+        graph = self.g
+        assert graph is not None, 'Graph (Pathfinder.g) not initialized!'
+
+        if graph is not self.cache_graph:
+            self.cache.clear()
+            self.cache_graph = graph
+
+        start = tuple(start)
+        goal = tuple(goal)
+        key = (getattr(graph,'version',0),self.alg,start,goal)
+        try:
+            return self.cache.get(key)
+        except KeyError:
+            pass
+
+        path = self.search_path(graph,start,goal)
+        self.cache.put(key,path)
+        return path
+
+    def search_path(self,graph,start,goal):
+        """ Runs the search for find_path, bypassing the cache """
+        if start==goal:
+            return (start,)
+
+        if flat_graph(graph,start,goal):
+            if self.alg==Pathfinder.b_first:
+                parent,visited = grid_bfs(graph,start,goal,self.early_exit)
+            elif self.alg==Pathfinder.jps:
+                g,parent,visited = grid_jps(graph,start,goal,self.early_exit)
+            else:
+                g,parent,visited = grid_search(
+                                graph,start,goal,
+                                self.alg==Pathfinder.gb_first,self.early_exit
+                                )
+            i = graph.index(goal)
+            if parent[i]<0:
+                return None
+            path = []
+            while i>=0:
+                path.append(graph.point(i))
+                i = parent[i]
+            path.reverse()
+            return tuple(fill_path(path))
+
+        self.start = start
+        self.dest = goal
+        results = self.execute()
+        if results is False:
+            return None
+        if isinstance(results,tuple):
+            results = results[0]        # A* also returns the costs
+        if goal not in results:
+            return None
+
+        path = [goal]
+        while path[-1]!=start:
+            path.append(results[path[-1]])
+        path.reverse()
+        return tuple(fill_path(path))
+
     def gbf_search(self,graph,start,goal):
         """ Greedy Best-First search """
+        if flat_graph(graph,start,goal):
+            g,parent,visited = grid_search(
+                                        graph,start,goal,
+                                        True,self.early_exit
+                                        )
+            return graph.came_from(parent,visited)
+
         frontier = PriorityQueue()
         frontier.put(start,0)
         came_from = {}
@@ -91,10 +214,14 @@ class Pathfinder:
 
     def bf_search(self,graph,start,goal):
         """ Breadth-First algorithm search function """
+        if flat_graph(graph,start,goal):
+            parent,visited = grid_bfs(graph,start,goal,self.early_exit)
+            return graph.came_from(parent,visited)
+
         frontier = Queue()
         frontier.put(start)
         came_from = {}
-        came_from[start]=True
+        came_from[start] = None
 
         # Loop until the frontier is empty
         while not frontier.empty():
@@ -105,15 +232,21 @@ class Pathfinder:
             if current == goal and self.early_exit:
                 break
 
-            for next in graph.neighbors(current):
+            for next in graph.neighbor(current):
                 if next not in came_from:
-                    priority = heuristic(goal,next)
-                    frontier.put(next, priority)
-                    came_from[next] = True
+                    frontier.put(next)
+                    came_from[next] = current
 
         return came_from
 
     def a_star(self,graph,start,goal):
+        if flat_graph(graph,start,goal):
+            g,parent,visited = grid_search(
+                                        graph,start,goal,
+                                        False,self.early_exit
+                                        )
+            return graph.came_from(parent,visited),graph.costs(g,visited)
+
         frontier = PriorityQueue()
         frontier.put(start,0)
         came_from = {}
@@ -137,30 +270,141 @@ class Pathfinder:
 
         return came_from, cost_so_far
 
+    def jps_search(self,graph,start,goal):
+        """ Jump point search, A* results over jump points only
+
+        came_from maps each jump point to the previous one, a straight
+        line away; find_path fills in the cells between.  Graphs without
+        a passability bitmap are searched with A* instead.
+        """
+        if not flat_graph(graph,start,goal):
+            return self.a_star(graph,start,goal)
+
+        g,parent,visited = grid_jps(graph,start,goal,self.early_exit)
+        return graph.came_from(parent,visited),graph.costs(g,visited)
+
     def heuristic(self,a,b):
         (x1,y1) = a
         (x2,y2) = b
         return abs(x1-x2) + abs(y1-y2)
 
-class GraphGrid:
+class GraphGrid(object):
 
-    def __init__(self,grid):
+    """ 4-connected grid graph over (x,y) points """
 
-        # Detect grid size
-        self.dim_y = len(grid)
-        self.dim_x = len(grid[0])
+    # Passability is a bytearray bitmap, 1 = passable, over the grid
+    # padded with a blocked border : point (x,y) is cell
+    # (y+1)*width+x+1, width = dim_x+2, so the 4 neighbors of any cell
+    # are fixed offsets that never leave the array.
+    #
+    # impassable may be assigned any collection of (x,y), which rebuilds
+    # the bitmap; single points are changed with set_passable().  Both
+    # bump version, which keys Pathfinder's path cache.  Reading
+    # impassable gives a frozenset built from the bitmap, so it can't be
+    # changed in place : use set_passable() instead.
+
+    def __init__(self,grid=None,dim_x=None,dim_y=None):
 
-        self.impassable = None
+        # Detect grid size
+        if grid is not None:
+            dim_y = len(grid)
+            dim_x = len(grid[0])
+        self.dim_x = dim_x
+        self.dim_y = dim_y
+        self.width = dim_x+2
+
+        # Neighbor offsets, in neighbor() order : east, north, west, south
+        self.offsets = (1,-self.width,-1,self.width)
+        self.cells = None
+        self.version = 0        # Bumped on every passability change
+
+    @classmethod
+    def from_world(cls,grid,z,impassable=('0','L')):
+        """ Builds the graph of floor z of a WorldGrid
+
+        impassable are the blocking tile values, walls and locked doors
+        by default.
+        """
+        graph = cls(dim_x=grid.dim_x,dim_y=grid.dim_y)
+        table = bytearray('\x01'*256)
+        for tile in impassable:
+            table[ord(tile)] = 0
+
+        pad = bytearray(1)
+        cells = bytearray(graph.width)
+        for y in range(grid.dim_y):
+            cells += pad+bytearray(grid.row(y,z)).translate(table)+pad
+        cells += bytearray(graph.width)
+        graph.cells = cells
+        return graph
+
+    @property
+    def impassable(self):
+        """ Frozenset of impassable (x,y), None if never assigned """
+        if self.cells is None:
+            return None
+        return frozenset(
+                self.point(i) for i in range(len(self.cells))
+                if not self.cells[i] and self.in_bounds(self.point(i))
+                )
+
+    @impassable.setter
+    def impassable(self,points):
+        self.version += 1
+        if points is None:
+            self.cells = None
+            return
+
+        # Everything in bounds is open, the border stays blocked
+        cells = bytearray(self.width*(self.dim_y+2))
+        row = bytearray('\x01'*self.dim_x)
+        for y in range(self.dim_y):
+            start = (y+1)*self.width+1
+            cells[start:start+self.dim_x] = row
+        for pt in points:
+            if self.in_bounds(pt):
+                cells[self.index(pt)] = 0
+        self.cells = cells
+
+    def set_passable(self,id,passable=True):
+        assert self.cells is not None, 'Not assigned! grid.set_passable'
+        i = self.index(id)
+        value = 1 if passable else 0
+        if self.cells[i]!=value:
+            self.cells[i] = value
+            self.version += 1
+
+    def index(self,id):
+        """ Returns the bitmap cell of point id """
+        return (id[1]+1)*self.width+id[0]+1
+
+    def point(self,i):
+        """ Returns the point of bitmap cell i """
+        y,x = divmod(i,self.width)
+        return (x-1,y-1)
+
+    def came_from(self,parent,cells):
+        """ Converts a parent array to the came_from dict of the cells """
+        point = self.point
+        return dict(
+                (point(i),point(parent[i]) if parent[i]>=0 else None)
+                for i in cells
+                )
+
+    def costs(self,g,cells):
+        """ Converts a cost array to the cost_so_far dict of the cells """
+        point = self.point
+        return dict((point(i),g[i]) for i in cells)
 
     # Tests whether the point exists
     def in_bounds(self, id):
         (x,y) = id
         return 0 <= x < self.dim_x and 0 <= y < self.dim_y
 
-    # Checks for coordinate in list of unpassable tiles
+    # Checks the passability bitmap
     def passable(self, id):
-        assert self.impassable is not None, 'Not assigned! grid.passable'
-        return id not in self.impassable
+        assert self.cells is not None, 'Not assigned! grid.passable'
+        return self.cells[self.index(id)]==1
 
     # Sets edges by inspecting neighboring tiles
     def neighbor(self, id):
@@ -171,11 +415,235 @@ class GraphGrid:
         if (x+y) % 2 == 0:
             results.reverse()
 
-        results = filter(self.in_bounds, results)
-        results = filter(self.passable, results)
-        return results
+        assert self.cells is not None, 'Not assigned! grid.neighbor'
+        cells = self.cells
+        index = self.index
+        in_bounds = self.in_bounds
+        return [pt for pt in results if in_bounds(pt) and cells[index(pt)]]
+
+    def neighbor_offsets(self,parity):
+        """ Returns the offsets in neighbor() order for x+y parity """
+        if parity % 2 == 0:
+            return self.offsets[::-1]
+        return self.offsets
 
     # Calculates the movement cost
     def cost(self,start,end):
         return 1
 
+def flat_graph(graph,start,goal):
+    """ True if the search can run on graph's passability bitmap
+
+    Only plain GraphGrid moves qualify : a subclass overriding cost()
+    or neighbor() is searched through those methods.
+    """
+    return (
+        getattr(graph,'cells',None) is not None and
+        inherits(graph,'cost') and inherits(graph,'neighbor') and
+        graph.in_bounds(start) and graph.in_bounds(goal)
+        )
+
+def inherits(graph,name):
+    """ True if graph's class uses GraphGrid's own method name """
+    method = getattr(graph.__class__,name,None)
+    return getattr(method,'__func__',None) is getattr(GraphGrid,name).__func__
+
+def grid_search(graph,start,goal,greedy=False,early_exit=True):
+    """ A* (or greedy best-first) over a GraphGrid's bitmap
+
+    Works on flat cell indices with array-backed costs and parents.
+    Equal f ties go to the cell nearest the goal, which keeps A* from
+    flooding open areas.
+    Returns (g,parent,visited) : arrays of path cost and parent cell by
+    cell (-1 if unreached) and the list of cells reached, start first.
+    """
+    cells = graph.cells
+    width = graph.width
+    n = len(cells)
+    src = graph.index(start)
+    dst = graph.index(goal)
+    gx = goal[0]+1      # Goal in padded coordinates
+    gy = goal[1]+1
+
+    g = array('i',[-1])*n
+    parent = array('i',[-1])*n
+    closed = bytearray(n)
+    g[src] = 0
+    visited = [src]
+
+    even = graph.neighbor_offsets(0)
+    odd = graph.neighbor_offsets(1)
+    scale = n       # Priority is f*scale+h, and h<n
+    push = heapq.heappush
+    pop = heapq.heappop
+    heap = [(0,src)]
+
+    while heap:
+        f,i = pop(heap)
+        if closed[i]:
+            continue
+        closed[i] = 1
+        if i==dst and early_exit:
+            break
+
+        y,x = divmod(i,width)
+        cost = g[i]+1
+        for o in (odd if (x+y)&1 else even):
+            j = i+o
+            if not cells[j] or closed[j]:
+                continue
+            old = g[j]
+            if old==-1:
+                visited.append(j)
+            elif greedy or cost>=old:
+                continue
+            g[j] = cost
+            parent[j] = i
+            jy,jx = divmod(j,width)
+            h = abs(jx-gx)+abs(jy-gy)
+            push(heap,(h if greedy else (cost+h)*scale+h,j))
+
+    return g,parent,visited
+
+def grid_jps(graph,start,goal,early_exit=True):
+    """ Jump point search over a GraphGrid's bitmap
+
+    The 4-connected form of JPS : a horizontal jump runs until the goal
+    or a forced neighbor, a cell whose side is open where the cell
+    behind it was blocked.  A vertical jump also stops where a
+    horizontal jump from it would find a jump point.  Every cell costs
+    1, so paths are as short as A*'s.
+
+    Returns (g,parent,visited) like grid_search, over jump points only.
+    """
+    cells = graph.cells
+    width = graph.width
+    n = len(cells)
+    src = graph.index(start)
+    dst = graph.index(goal)
+    gx = goal[0]+1      # Goal in padded coordinates
+    gy = goal[1]+1
+
+    def jump_x(i,d):
+        while cells[i]:
+            if i==dst:
+                return i
+            if ((cells[i-width] and not cells[i-d-width]) or
+                    (cells[i+width] and not cells[i-d+width])):
+                return i
+            i += d
+        return -1
+
+    def jump_y(i,d):
+        while cells[i]:
+            if i==dst:
+                return i
+            if ((cells[i-1] and not cells[i-1-d]) or
+                    (cells[i+1] and not cells[i+1-d])):
+                return i
+            if jump_x(i+1,1)>=0 or jump_x(i-1,-1)>=0:
+                return i
+            i += d
+        return -1
+
+    g = array('i',[-1])*n
+    parent = array('i',[-1])*n
+    closed = bytearray(n)
+    g[src] = 0
+    visited = [src]
+
+    scale = n       # Priority is f*scale+h, and h<n
+    push = heapq.heappush
+    pop = heapq.heappop
+    heap = [(0,src)]
+
+    while heap:
+        f,i = pop(heap)
+        if closed[i]:
+            continue
+        closed[i] = 1
+        if i==dst and early_exit:
+            break
+
+        # Prune to the natural and forced directions from the parent
+        p = parent[i]
+        y,x = divmod(i,width)
+        if p<0:
+            dirs = graph.offsets
+        else:
+            py,px = divmod(p,width)
+            if py==y:
+                d = 1 if x>px else -1
+                dirs = (d,-width,width)
+            else:
+                d = width if y>py else -width
+                dirs = (d,-1,1)
+
+        for o in dirs:
+            if not cells[i+o]:
+                continue
+            if o==1 or o==-1:
+                j = jump_x(i+o,o)
+            else:
+                j = jump_y(i+o,o)
+            if j<0 or closed[j]:
+                continue
+
+            jy,jx = divmod(j,width)
+            cost = g[i]+abs(jx-x)+abs(jy-y)
+            old = g[j]
+            if old==-1:
+                visited.append(j)
+            elif cost>=old:
+                continue
+            g[j] = cost
+            parent[j] = i
+            h = abs(jx-gx)+abs(jy-gy)
+            push(heap,((cost+h)*scale+h,j))
+
+    return g,parent,visited
+
+def fill_path(points):
+    """ Returns points with the straight runs between them filled in """
+    if not points:
+        return points
+    path = [points[0]]
+    for x,y in points[1:]:
+        px,py = path[-1]
+        dx = (x>px)-(x<px)
+        dy = (y>py)-(y<py)
+        while (px,py)!=(x,y):
+            px += dx
+            py += dy
+            path.append((px,py))
+    return path
+
+def grid_bfs(graph,start,goal,early_exit=True):
+    """ Breadth-first search over a GraphGrid's bitmap
+
+    Returns (parent,visited) : the parent array, -1 where unreached or
+    at start, and the list of cells reached in visiting order.
+    """
+    cells = graph.cells
+    src = graph.index(start)
+    dst = graph.index(goal)
+    seen = bytearray(len(cells))
+    seen[src] = 1
+    parent = array('i',[-1])*len(cells)
+    visited = [src]
+    offsets = graph.offsets
+
+    k = 0
+    while k<len(visited):
+        i = visited[k]
+        k += 1
+        if i==dst and early_exit:
+            break
+        for o in offsets:
+            j = i+o
+            if cells[j] and not seen[j]:
+                seen[j] = 1
+                parent[j] = i
+                visited.append(j)
+
+    return parent,visited
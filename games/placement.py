@@ -0,0 +1,170 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+import math
+
+# Point placement for stairs and waypoints.  Every sampler here finishes
+# in bounded time : constraints that cannot be met are reported to the
+# caller (None, or fewer points than asked for) rather than retried
+# forever.
+#
+# Candidate areas are lists of segments, (axis,fixed,lo,hi) with axis 0
+# a row (y=fixed, x in lo..hi) and axis 1 a column (x=fixed, y in
+# lo..hi), bounds inclusive.  A min-distance constraint cuts at most one
+# interval out of each segment, so the points far enough from an anchor
+# are counted and drawn from exactly, without rejection.
+
+class PlacementError(Exception):
+    """ Raised when there is nowhere at all to place a point """
+    pass
+
+def edge_segments(dim_x,dim_y):
+    """ Returns the segments of the floor edge, corners excluded """
+    segments = []
+    if dim_x>2:
+        segments.append((0,0,1,dim_x-2))
+        if dim_y>1:
+            segments.append((0,dim_y-1,1,dim_x-2))
+    if dim_y>2:
+        segments.append((1,0,1,dim_y-2))
+        if dim_x>1:
+            segments.append((1,dim_x-1,1,dim_y-2))
+    return segments
+
+def floor_segments(dim_x,dim_y):
+    """ Returns the segments of a whole floor, one per row """
+    return [(0,y,0,dim_x-1) for y in range(dim_y)]
+
+def far_spans(segment,anchor,min_dist):
+    """ Returns the (lo,hi) spans of segment at least min_dist from anchor """
+    axis,fixed,lo,hi = segment
+    if anchor is None or min_dist<=0:
+        return [(lo,hi)]
+
+    along = anchor[axis]
+    across = fixed-anchor[1-axis]
+    left = min_dist**2-across**2
+    if left<=0:
+        return [(lo,hi)]
+
+    # Points with |v-along| >= reach are far enough
+    reach = math.sqrt(left)
+    below = int(math.floor(along-reach))
+    above = int(math.ceil(along+reach))
+
+    spans = []
+    if below>=lo:
+        spans.append((lo,min(hi,below)))
+    if above<=hi:
+        spans.append((max(lo,above),hi))
+    return spans
+
+def sample_far(rng,segments,anchor=None,min_dist=0):
+    """ Draws a point of segments at least min_dist from anchor
+
+    Every qualifying point is equally likely.  Returns (x,y), or None
+    when no point of segments is far enough.
+    """
+    spans = []
+    total = 0
+    for segment in segments:
+        for lo,hi in far_spans(segment,anchor,min_dist):
+            spans.append((segment[0],segment[1],lo,hi))
+            total += hi-lo+1
+
+    if not total:
+        return None
+
+    pick = rng.randint(0,total-1)
+    for axis,fixed,lo,hi in spans:
+        if pick<=hi-lo:
+            v = lo+pick
+            return (v,fixed) if axis==0 else (fixed,v)
+        pick -= hi-lo+1
+
+def farthest(segments,anchor):
+    """ Returns the point of segments farthest from anchor """
+    best = None
+    best_dist = -1
+    for axis,fixed,lo,hi in segments:
+        for v in (lo,hi):
+            pt = (v,fixed) if axis==0 else (fixed,v)
+            dist = (pt[0]-anchor[0])**2+(pt[1]-anchor[1])**2
+            if dist>best_dist:
+                best,best_dist = pt,dist
+    return best
+
+class PoissonDisc(object):
+
+    """ Dart-throwing Poisson-disc sampler over integer points """
+
+    # Accepted points are bucketed on a background grid of cells radius
+    # /sqrt(2) wide, so testing a dart only looks at the 5x5 cells
+    # around it instead of every point placed so far.
+    #
+    # sample() throws a bounded number of darts per missing point.  If
+    # that is not enough the radius shrinks and sampling goes on with
+    # the points already accepted (they still satisfy the smaller
+    # radius).  Below a radius of 1 only distinct points are required.
+
+    shrink = 0.75
+    attempts = 30
+
+    def __init__(self,lo,hi,radius,rng):
+        self.lo = lo            # (x,y) lower corner, inclusive
+        self.hi = hi            # (x,y) upper corner, inclusive
+        self.rng = rng
+        self.points = []
+        self.set_radius(radius)
+
+    def set_radius(self,radius):
+        self.radius = max(float(radius),1.0)
+        self.cell = self.radius/math.sqrt(2)
+        self.buckets = {}
+        for pt in self.points:
+            self.bucket(pt).append(pt)
+
+    def bucket(self,pt):
+        key = (int(pt[0]//self.cell),int(pt[1]//self.cell))
+        return self.buckets.setdefault(key,[])
+
+    def add(self,pt):
+        """ Accepts pt unconditionally, later darts keep their distance """
+        pt = (pt[0],pt[1])
+        self.points.append(pt)
+        self.bucket(pt).append(pt)
+
+    def fits(self,pt):
+        cx = int(pt[0]//self.cell)
+        cy = int(pt[1]//self.cell)
+        limit = self.radius**2
+        for y in range(cy-2,cy+3):
+            for x in range(cx-2,cx+3):
+                for other in self.buckets.get((x,y),()):
+                    if (other[0]-pt[0])**2+(other[1]-pt[1])**2<limit:
+                        return False
+        return True
+
+    def sample(self,count):
+        """ Places up to count new points, returns them in draw order
+
+        Fewer than count points come back only when the area cannot
+        hold that many distinct points or the final darts all missed.
+        """
+        placed = []
+        randint = self.rng.randint
+        while True:
+            tries = PoissonDisc.attempts*(count-len(placed))
+            while tries and len(placed)<count:
+                tries -= 1
+                pt = (
+                    randint(self.lo[0],self.hi[0]),
+                    randint(self.lo[1],self.hi[1])
+                    )
+                if self.fits(pt):
+                    self.add(pt)
+                    placed.append(pt)
+
+            if len(placed)==count or self.radius<=1.0:
+                return placed
+            self.set_radius(self.radius*PoissonDisc.shrink)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import time
+
+try:
+    import resource
+except ImportError:     # Not available on Windows
+    resource = None
+
+class Profiler(object):
+
+    """ Per-phase wall/CPU timers, call counters and peak memory """
+
+    # Phases are timed with "with profiler.phase('name'):" and nest
+    # freely; a phase entered several times accumulates.  Counters are
+    # bumped with count('name').  report() returns everything as a dict
+    # ready for JSON.
+    #
+    # Code that is always instrumented should be handed null_profiler
+    # when profiling is off : its phase() and count() do no work.
+
+    enabled = True
+
+    def __init__(self):
+        self.phases = {}        # name -> [calls,wall,cpu]
+        self.counters = {}      # name -> count
+        self.order = []         # Phase names, first entered first
+
+    def phase(self,name):
+        return PhaseTimer(self,name)
+
+    def count(self,name,n=1):
+        self.counters[name] = self.counters.get(name,0)+n
+
+    def add(self,name,wall,cpu):
+        try:
+            entry = self.phases[name]
+        except KeyError:
+            entry = self.phases[name] = [0,0.0,0.0]
+            self.order.append(name)
+        entry[0] += 1
+        entry[1] += wall
+        entry[2] += cpu
+
+    def report(self):
+        """ Returns the timings, counters and peak memory as a dict """
+        return {
+            'phases':[
+                    {
+                    'name':name,
+                    'calls':self.phases[name][0],
+                    'wall':self.phases[name][1],
+                    'cpu':self.phases[name][2]
+                    }
+                    for name in self.order
+                    ],
+            'counters':dict(self.counters),
+            'peak_rss_kb':peak_rss_kb()
+            }
+
+    def save(self,fpath):
+        """ Writes report() to fpath as JSON """
+        with open(fpath,'w') as outfile:
+            json.dump(self.report(),outfile,indent=2,sort_keys=True)
+
+class PhaseTimer(object):
+
+    """ Context manager timing one entry into a phase """
+
+    def __init__(self,profiler,name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.cpu = time.clock()
+        return self
+
+    def __exit__(self,*exc):
+        self.profiler.add(
+                        self.name,
+                        time.time()-self.wall,
+                        time.clock()-self.cpu
+                        )
+
+class NullProfiler(Profiler):
+
+    """ Profiler stand-in that records nothing """
+
+    # Its phase() is the profiler itself as a no-op context manager,
+    # and report()/save() give the empty report of a fresh Profiler.
+
+    enabled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        pass
+
+    def phase(self,name):
+        return self
+
+    def count(self,name,n=1):
+        pass
+
+    def add(self,name,wall,cpu):
+        pass
+
+null_profiler = NullProfiler()
+
+def peak_rss_kb():
+    """ Returns this process' peak resident size in KB, None if unknown """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform=='darwin':  # Reported in bytes there
+        peak //= 1024
+    return peak
@@ -0,0 +1,205 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+import heapq
+from array import array
+
+# Cost to the goal of an unreachable cell
+inf = 1<<30
+
+class Replanner(object):
+
+    """ D* Lite planner that repairs its search when passability changes """
+
+    # Searches backward from the goal over a GraphGrid's passability
+    # bitmap, keeping g (cost to goal) and rhs (one step lookahead) for
+    # every cell between calls.  When doors lock or walls open, only
+    # the cells around the change are re-queued, and plan() repairs
+    # the part of the search tree they affect instead of starting over.
+    # The agent may move between plans with move_start().
+    #
+    # The planner keeps its own copy of the bitmap.  plan() compares it
+    # with the graph whenever the graph's version has changed, so cells
+    # may be toggled with GraphGrid.set_passable() as usual.
+
+    def __init__(self,graph,start,goal):
+        assert graph.cells is not None, 'Not assigned! Replanner graph'
+        self.graph = graph
+        self.cells = bytearray(graph.cells)
+        self.version = getattr(graph,'version',0)
+        self.width = graph.width
+
+        n = len(self.cells)
+        self.g = array('i',[inf])*n
+        self.rhs = array('i',[inf])*n
+        self.queue = []         # Heap of (key,cell), may hold stale keys
+        self.keys = {}          # Cell -> its current key, if queued
+        self.km = 0             # Heuristic offset from start moves
+        self.expanded = 0       # Cells expanded by the last plan()
+
+        self.goal = graph.index(goal)
+        self.set_start(self.graph.index(start))
+        self.last = self.start
+        self.rhs[self.goal] = 0
+        self.push(self.goal)
+
+    def set_start(self,i):
+        self.start = i
+        self.sy,self.sx = divmod(i,self.width)
+
+    def heuristic(self,i):
+        """ Manhattan distance from the start to cell i """
+        y,x = divmod(i,self.width)
+        return abs(x-self.sx)+abs(y-self.sy)
+
+    def key(self,i):
+        """ The [k1;k2] key of cell i packed in one int, k1<<31|k2 """
+        k2 = min(self.g[i],self.rhs[i])
+        y,x = divmod(i,self.width)
+        k1 = min(k2+abs(x-self.sx)+abs(y-self.sy)+self.km,inf)
+        return k1<<31|k2
+
+    def push(self,i):
+        k = self.key(i)
+        self.keys[i] = k
+        heapq.heappush(self.queue,(k,i))
+
+    def top(self):
+        """ Returns the smallest current (key,cell), dropping stale ones """
+        queue = self.queue
+        keys = self.keys
+        while queue:
+            k,i = queue[0]
+            if keys.get(i)==k:
+                return k,i
+            heapq.heappop(queue)
+        return inf<<31|inf,-1
+
+    def update(self,i):
+        """ Recomputes rhs of cell i and requeues it if inconsistent """
+        cells = self.cells
+        g = self.g
+        rhs = self.rhs
+        if i!=self.goal:
+            best = inf
+            if cells[i]:
+                for o in self.graph.offsets:
+                    j = i+o
+                    if cells[j] and g[j]<best:
+                        best = g[j]
+                best = min(best+1,inf)
+            rhs[i] = best
+
+        if g[i]!=rhs[i]:
+            self.push(i)
+        else:
+            self.keys.pop(i,None)
+
+    def changed(self,i):
+        """ Requeues cell i and its neighbors after i was toggled """
+        self.update(i)
+        for o in self.graph.offsets:
+            j = i+o
+            if self.cells[j]:
+                self.update(j)
+
+    def sync(self):
+        """ Picks up the cells toggled in the graph since the last sync
+
+        Returns the number of cells that changed.
+        """
+        graph = self.graph
+        version = getattr(graph,'version',0)
+        if version==self.version:
+            return 0
+        self.version = version
+
+        # Compare row slices first, so only differing rows are walked
+        cells = self.cells
+        new = graph.cells
+        width = self.width
+        changed = []
+        for start in range(0,len(cells),width):
+            end = start+width
+            if cells[start:end]!=new[start:end]:
+                changed.extend(
+                        i for i in range(start,end) if cells[i]!=new[i]
+                        )
+
+        for i in changed:
+            cells[i] = new[i]
+        for i in changed:
+            self.changed(i)
+        return len(changed)
+
+    def move_start(self,pt):
+        """ Moves the agent to pt before the next plan() """
+        self.set_start(self.graph.index(pt))
+        self.km += self.heuristic(self.last)
+        self.last = self.start
+
+    def plan(self):
+        """ Repairs the search and returns the path, None if unreachable
+
+        The path is a tuple of points from the start to the goal.
+        """
+        self.sync()
+
+        g = self.g
+        rhs = self.rhs
+        cells = self.cells
+        offsets = self.graph.offsets
+        start = self.start
+        key = self.key
+        update = self.update
+        expanded = 0
+
+        while True:
+            k_old,i = self.top()
+            if i<0:
+                break
+            if k_old>=key(start) and rhs[start]==g[start]:
+                break
+
+            k_new = key(i)
+            if k_old<k_new:
+                self.push(i)
+                continue
+
+            heapq.heappop(self.queue)
+            del self.keys[i]
+            expanded += 1
+            if g[i]>rhs[i]:
+                g[i] = rhs[i]
+            else:
+                g[i] = inf
+                update(i)
+            for o in offsets:
+                j = i+o
+                if cells[j]:
+                    update(j)
+
+        self.expanded = expanded
+        return self.path()
+
+    def path(self):
+        """ Follows the cheapest neighbors from the start to the goal """
+        g = self.g
+        cells = self.cells
+        i = self.start
+        if g[i]>=inf or not cells[i]:
+            return None
+
+        point = self.graph.point
+        path = [point(i)]
+        while i!=self.goal:
+            best = -1
+            for o in self.graph.offsets:
+                j = i+o
+                if cells[j] and (best<0 or g[j]<g[best]):
+                    best = j
+            if best<0 or g[best]>=g[i]:
+                return None
+            i = best
+            path.append(point(i))
+        return tuple(path)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+import re
+import ast
+from tiles import WorldTile
+from world_grid import WorldGrid
+
+# Run-length encoded floors and map files.
+#
+# A row is encoded as comma separated runs, 'tile*count', with the
+# count left out for runs of one :
+#
+#   '0*12,1,3*4,0*13'
+#
+# Rows are encoded independently, so any row decodes on its own and a
+# floor decodes row by row with one join per row.  Tiles are the single
+# character WorldTile values, never ',' or '*'.
+#
+# An RLE map file is python source, like map_template, holding
+#
+#   map_rle = (dim_x,dim_y,((row,...),...))
+#
+# with one tuple of encoded rows per floor.  Like map_template it holds
+# tiles only, colors are not kept.
+
+run_re = re.compile(r'(.)\1*',re.S)
+
+def encode_row(row):
+    """ Returns row, a string of tiles, run-length encoded """
+    parts = []
+    for match in run_re.finditer(row):
+        count = match.end()-match.start()
+        if count==1:
+            parts.append(match.group(1))
+        else:
+            parts.append('{}*{}'.format(match.group(1),count))
+    return ','.join(parts)
+
+def decode_row(text):
+    """ Returns the string of tiles an encoded row stands for """
+    return ''.join([
+                run if len(run)==1 else run[0]*int(run[2:])
+                for run in text.split(',')
+                ])
+
+class RLEFloor(object):
+
+    """ One floor held as run-length encoded rows """
+
+    def __init__(self,dim_x,dim_y,z,rows):
+        self.dim_x = dim_x
+        self.dim_y = dim_y
+        self.z = z
+        self.rows = rows        # Encoded row strings, top to bottom
+
+    @classmethod
+    def from_grid(cls,grid,z):
+        """ Encodes floor z of a WorldGrid """
+        return cls(
+                grid.dim_x,grid.dim_y,z,
+                [encode_row(grid.row(y,z)) for y in range(grid.dim_y)]
+                )
+
+    def __len__(self):
+        """ Encoded size in characters """
+        return sum(len(row) for row in self.rows)
+
+    def row(self,y):
+        """ Returns row y as a string of tiles """
+        return decode_row(self.rows[y])
+
+    def tile(self,x,y):
+        if not 0<=x<self.dim_x:
+            raise KeyError((x,y,self.z))
+        return self.row(y)[x]
+
+    def tiles(self):
+        """ Returns the whole floor as one string of tiles """
+        return ''.join([decode_row(row) for row in self.rows])
+
+    def to_grid(self,grid):
+        """ Writes this floor into grid at its own z """
+        grid.load_floor(self.z,self.tiles())
+
+def dumps(grid,floors=None):
+    """ Returns floors (default: all) of grid as RLE map source """
+    if floors is None:
+        floors = grid.floors
+
+    o = 'map_rle = (\n  {},{},\n  (\n'.format(grid.dim_x,grid.dim_y)
+    for z in range(grid.base_z,grid.base_z+floors):
+        o += '    (\n'
+        for y in range(grid.dim_y):
+            o += '      {!r},\n'.format(encode_row(grid.row(y,z)))
+        o += '    ),\n'
+    o += '  ),\n)\n'
+    return o
+
+def loads(text):
+    """ Returns the RLEFloors of RLE map source, floors counted from 0 """
+    name,sep,value = text.partition('=')
+    if name.strip()!='map_rle' or not sep:
+        raise ValueError('Not an RLE map : no map_rle assignment')
+
+    dim_x,dim_y,floors = ast.literal_eval(value.strip())
+    return [
+            RLEFloor(dim_x,dim_y,z,list(rows))
+            for z,rows in enumerate(floors)
+            ]
+
+def save(grid,fpath,floors=None):
+    with open(fpath,'w') as outfile:
+        outfile.write(dumps(grid,floors))
+
+def load(fpath):
+    """ Reads an RLE map file into a WorldGrid """
+    with open(fpath) as infile:
+        floors = loads(infile.read())
+    if not floors:
+        raise ValueError('RLE map {} holds no floors'.format(fpath))
+
+    grid = WorldGrid(
+                    floors[0].dim_x,floors[0].dim_y,len(floors),
+                    WorldTile.wall
+                    )
+    for tile_type in WorldTile.stairs:
+        grid.index_tile(tile_type)
+    for floor in floors:
+        floor.to_grid(grid)
+    return grid
@@ -0,0 +1,164 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+import collections
+from tiles import WorldTile
+from connectivity import FloorLabels
+
+# Tiles that make up rooms and corridors.  Stairs (WorldTile.stairs)
+# belong to the room around them, see RoomGraph.stairs.
+room_tiles = (WorldTile.dungeon,WorldTile.shop,WorldTile.boss)
+corridor_tiles = (WorldTile.hallway,WorldTile.door)
+
+# A labeled room or corridor.  id is (z,label), centroid the mean (x,y)
+# of its tiles, bbox (x0,y0,x1,y1) inclusive.
+Region = collections.namedtuple('Region','id tiles centroid bbox')
+
+class RoomGraph(object):
+
+    """ Rooms, corridors and the doorways between them """
+
+    # Each floor is labeled twice with FloorLabels, once for room tiles
+    # and once for corridor tiles.  Everything else is derived from the
+    # label runs rather than tile by tile : region sizes, centroids and
+    # boxes sum over runs, and a doorway is found where a room run ends
+    # beside a corridor tile or overlaps a corridor run on the next row.
+    #
+    # Doorways are the corridor tiles touching a room.  Stairs count as
+    # room tiles, so they land in the room they were placed in.
+
+    def __init__(self,grid,floors=None):
+        if floors is None:
+            floors = range(grid.base_z,grid.base_z+grid.floors)
+
+        self.rooms = {}         # id -> Region
+        self.corridors = {}     # id -> Region
+        self.doors = {}         # (room id,corridor id) -> [(x,y,z)]
+        self.stairs = {}        # (x,y,z) -> room id
+
+        for z in floors:
+            self.scan_floor(grid,z)
+
+    def scan_floor(self,grid,z):
+        rooms = FloorLabels(grid,z,passable=room_tiles+WorldTile.stairs)
+        halls = FloorLabels(grid,z,passable=corridor_tiles)
+
+        self.rooms.update(regions(rooms,z))
+        self.corridors.update(regions(halls,z))
+
+        for tile_type in WorldTile.stairs:
+            for x,y in grid.positions(z,tile_type):
+                self.stairs[x,y,z] = (z,rooms.label((x,y)))
+
+        dim_x = grid.dim_x
+        room_rows = rows_of(rooms.runs,grid.dim_y)
+        hall_rows = rows_of(halls.runs,grid.dim_y)
+
+        doors = collections.defaultdict(set)
+        for y,row in enumerate(room_rows):
+            for label,ry,a,b in row:
+                # Corridor tiles just left and right of the run
+                for x in (a-1,b):
+                    if 0<=x<dim_x:
+                        hall = halls.labels[y*dim_x+x]
+                        if hall:
+                            doors[(z,label),(z,hall)].add((x,y,z))
+
+            # Corridor runs overlapping room runs on the rows above and
+            # below, both lists are sorted so one sweep finds them all
+            for cy in (y-1,y+1):
+                if not 0<=cy<grid.dim_y:
+                    continue
+                other = hall_rows[cy]
+                j = 0
+                for label,ry,a,b in row:
+                    while j<len(other) and other[j][3]<=a:
+                        j += 1
+                    k = j
+                    while k<len(other) and other[k][2]<b:
+                        hall,hy,ca,cb = other[k]
+                        points = doors[(z,label),(z,hall)]
+                        for x in range(max(a,ca),min(b,cb)):
+                            points.add((x,cy,z))
+                        k += 1
+
+        for key,points in doors.items():
+            self.doors[key] = sorted(points)
+
+    def room_of(self,pt):
+        """ Returns the id of the room holding stairs pt, or None """
+        return self.stairs.get(tuple(pt))
+
+    def adjacency(self):
+        """ Returns {room id:set(room ids)} for rooms sharing a corridor """
+        by_hall = collections.defaultdict(set)
+        for room,hall in self.doors:
+            by_hall[hall].add(room)
+
+        retval = dict((room,set()) for room in self.rooms)
+        for rooms in by_hall.values():
+            for room in rooms:
+                retval[room].update(rooms)
+                retval[room].discard(room)
+        return retval
+
+    def to_dict(self):
+        """ Returns the graph as plain lists and dicts, ready for JSON """
+        def region(r):
+            return {
+                'id':list(r.id),
+                'tiles':r.tiles,
+                'centroid':list(r.centroid),
+                'bbox':list(r.bbox)
+                }
+        return {
+            'rooms':[region(self.rooms[k]) for k in sorted(self.rooms)],
+            'corridors':[
+                    region(self.corridors[k]) for k in sorted(self.corridors)
+                    ],
+            'doors':[
+                    {'room':list(room),'corridor':list(hall),
+                     'points':[list(pt) for pt in self.doors[room,hall]]}
+                    for room,hall in sorted(self.doors)
+                    ],
+            'stairs':[
+                    {'point':list(pt),'room':list(room)}
+                    for pt,room in sorted(self.stairs.items())
+                    ]
+            }
+
+def rows_of(runs,dim_y):
+    """ Groups label runs by row, each row stays sorted by x """
+    rows = [[] for y in range(dim_y)]
+    for run in runs:
+        rows[run[1]].append(run)
+    return rows
+
+def regions(labels,z):
+    """ Returns {id:Region} for every component of a FloorLabels """
+    tiles = collections.defaultdict(int)
+    sum_x = collections.defaultdict(int)
+    sum_y = collections.defaultdict(int)
+    boxes = {}
+
+    for label,y,a,b in labels.runs:
+        n = b-a
+        tiles[label] += n
+        sum_x[label] += (a+b-1)*n//2     # Sum of a..b-1
+        sum_y[label] += y*n
+        box = boxes.get(label)
+        if box is None:
+            boxes[label] = [a,y,b-1,y]
+        else:
+            box[0] = min(box[0],a)
+            box[2] = max(box[2],b-1)
+            box[3] = y
+
+    retval = {}
+    for label,n in tiles.items():
+        retval[z,label] = Region(
+                            (z,label),n,
+                            (sum_x[label]/float(n),sum_y[label]/float(n)),
+                            tuple(boxes[label])
+                            )
+    return retval
@@ -0,0 +1,66 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+import unittest
+from pathfinder import Pathfinder, GraphGrid, flat_graph
+
+class WeightedGrid(GraphGrid):
+
+    """ GraphGrid where entering column 1 costs 3 """
+
+    def cost(self,start,end):
+        return 3 if end[0]==1 else 1
+
+class DetourGrid(GraphGrid):
+
+    """ GraphGrid where column 1 costs 9 to enter except in row 3 """
+
+    def cost(self,start,end):
+        return 9 if end[0]==1 and end[1]!=3 else 1
+
+class FlatGraphTest(unittest.TestCase):
+
+    """ Subclasses overriding moves must not use the unit-cost bitmap """
+
+    def setUp(self):
+        # Start and goal on either side of column 1
+        self.start = (0,0)
+        self.goal = (2,0)
+
+    def test_plain_grid_is_flat(self):
+        graph = GraphGrid(dim_x=3,dim_y=3)
+        graph.impassable = []
+        self.assertTrue(flat_graph(graph,self.start,self.goal))
+
+    def test_weighted_subclass_is_not_flat(self):
+        graph = WeightedGrid(dim_x=3,dim_y=3)
+        graph.impassable = []
+        self.assertFalse(flat_graph(graph,self.start,self.goal))
+
+    def test_weighted_subclass_costs(self):
+        # One row, so the path must enter column 1 : 3+1, not 2 moves
+        graph = WeightedGrid(dim_x=3,dim_y=1)
+        graph.impassable = []
+        finder = Pathfinder(Pathfinder.a_star)
+        finder.g = graph
+        finder.start = self.start
+        finder.dest = self.goal
+        came_from,cost_so_far = finder.execute()
+        self.assertEqual(cost_so_far[self.goal],4)
+
+    def test_weighted_subclass_detour(self):
+        # Column 1 is cheap only in the bottom row, so the cheapest
+        # path goes around it : 8 moves costing 8, not 2 costing 10
+        graph = DetourGrid(dim_x=3,dim_y=4)
+        graph.impassable = []
+        finder = Pathfinder(Pathfinder.a_star)
+        finder.g = graph
+        path = finder.find_path(self.start,self.goal)
+        self.assertEqual(
+                        path,
+                        ((0,0),(0,1),(0,2),(0,3),(1,3),(2,3),(2,2),(2,1),
+                         (2,0))
+                        )
+
+if __name__=='__main__':
+    unittest.main()
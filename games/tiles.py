@@ -23,6 +23,9 @@ class WorldTile(object):
                 entry_point,descent_point,exit_point,
                 ascent_point]
 
+    # Stairs and exits, the tiles a WorldGrid keeps a position index for
+    stairs = (entry_point,descent_point,ascent_point,exit_point)
+
     def __init__(self,tile_name,tile_type,**kwargs):
         self.tile_name = tile_name
         self.tile_type = tile_type
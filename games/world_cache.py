@@ -0,0 +1,157 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+import os
+import errno
+import hashlib
+import inspect
+import logging
+import tempfile
+import cPickle as pickle
+from world_generator import WorldGenerator
+
+class WorldCache(object):
+
+    """ Disk-backed LRU cache of generated worlds """
+
+    # Each world is pickled to <path>/<key>.world, where key is a hash of
+    # the WorldGenerator parameters that shape the world plus the seed.
+    # A hit unpickles the finished generator (grid, way_list, start,
+    # end...) without running any generation phase.
+    #
+    # Recency is the file mtime, refreshed on every hit.  When the total
+    # size passes max_bytes the least recently used files are removed.
+
+    version = 11        # Bump when the pickled world layout changes
+    suffix = '.world'
+
+    def __init__(self,path,max_bytes=256*1024*1024,app_logger=None):
+        self.path = path
+        self.max_bytes = max_bytes
+
+        if app_logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = app_logger
+
+        try:
+            os.makedirs(self.path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def key(self,seed,**params):
+        """ Returns the cache key for a seed and WorldGenerator kwargs """
+
+        spec = inspect.getargspec(WorldGenerator.__init__)
+        defaults = dict(zip(spec.args[-len(spec.defaults):],spec.defaults))
+
+        # Explicit defaults and omitted parameters hash the same
+        parts = ['v{}'.format(WorldCache.version),'seed={}'.format(seed)]
+        for name in WorldGenerator.key_params:
+            val = params.get(name,defaults[name])
+            if name in ('dim_x','dim_y','dim_z'):
+                val = int(val)
+            parts.append('{}={!r}'.format(name,val))
+
+        return hashlib.sha1('|'.join(parts)).hexdigest()
+
+    def file_path(self,key):
+        return os.path.join(self.path,key+WorldCache.suffix)
+
+    def get(self,key,app_logger=None):
+        """ Returns the cached world for key, or None """
+
+        fpath = self.file_path(key)
+        try:
+            with open(fpath,'rb') as infile:
+                world = pickle.load(infile)
+        except (IOError,OSError):
+            return None
+        except (pickle.UnpicklingError,EOFError,AttributeError,ImportError):
+            self.logger.error('[*] Discarding unreadable cache entry {}'\
+                              .format(fpath))
+            self.remove(fpath)
+            return None
+
+        # Mark as most recently used
+        try:
+            os.utime(fpath,None)
+        except OSError:
+            pass
+
+        if app_logger is not None:
+            world.logger = app_logger
+        self.logger.debug('\tCache hit : {}'.format(key))
+        return world
+
+    def put(self,key,world):
+        """ Stores world under key, then evicts down to max_bytes """
+
+        # Write to a temp file and rename, so concurrent readers never
+        # see a partial entry
+        fd,tmp = tempfile.mkstemp(dir=self.path,suffix='.tmp')
+        try:
+            with os.fdopen(fd,'wb') as outfile:
+                pickle.dump(world,outfile,pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp,self.file_path(key))
+        except:
+            self.remove(tmp)
+            raise
+
+        self.logger.debug('\tCache store : {}'.format(key))
+        self.evict()
+
+    def world(self,seed=None,app_logger=None,**params):
+        """ Returns the world for seed and params, generating on a miss
+
+        Worlds without a seed are not reproducible, and lazy worlds hold
+        no grid yet, so both bypass the cache.
+        """
+        if seed is None or params.get('lazy'):
+            return WorldGenerator(seed=seed,app_logger=app_logger,**params)
+
+        key = self.key(seed,**params)
+        world = self.get(key,app_logger)
+        if world is None:
+            self.logger.debug('\tCache miss : {}'.format(key))
+            world = WorldGenerator(seed=seed,app_logger=app_logger,**params)
+            self.put(key,world)
+        return world
+
+    def entries(self):
+        """ Returns [(mtime,size,path)] for every entry, oldest first """
+        retval = []
+        for name in os.listdir(self.path):
+            if not name.endswith(WorldCache.suffix):
+                continue
+            fpath = os.path.join(self.path,name)
+            try:
+                st = os.stat(fpath)
+            except OSError:
+                continue
+            retval.append((st.st_mtime,st.st_size,fpath))
+        retval.sort()
+        return retval
+
+    def evict(self):
+        """ Removes least recently used entries until under max_bytes """
+        entries = self.entries()
+        total = sum(size for mtime,size,fpath in entries)
+
+        for mtime,size,fpath in entries:
+            if total <= self.max_bytes:
+                break
+            self.logger.debug('\tCache evict : {}'.format(fpath))
+            self.remove(fpath)
+            total -= size
+
+    def clear(self):
+        for mtime,size,fpath in self.entries():
+            self.remove(fpath)
+
+    def remove(self,fpath):
+        try:
+            os.remove(fpath)
+        except OSError:
+            pass
@@ -4,6 +4,9 @@
 import math
 import random
 import sys
+import os
+import hashlib
+import multiprocessing
 import pokeygame
 import argparse
 import inspect
@@ -12,12 +15,74 @@ import time
 from pathfinder import Pathfinder, GraphGrid
 from pokeyworks import ColorIze as color
 from tiles import  WorldTile
+from world_grid import WorldGrid
+from world_render import WorldRenderer
+from corridors import corridor, link_plan
+from connectivity import FloorLabels
+from caves import cave_floor
+from bsp import partition, room_center
+from profiler import Profiler, null_profiler
+from placement import PoissonDisc, PlacementError
+from placement import edge_segments, floor_segments, sample_far, farthest
 from pokeyworks import setup_logger as logger
 
+def derive_seed(seed,*salt):
+    """ Derives a child seed from seed and salt, stable across runs """
+    key = ':'.join(str(s) for s in (seed,)+salt)
+    return int(hashlib.sha1(key).hexdigest()[:15],16)
+
+def build_floor_job(job):
+    """ Floor worker, builds one floor of a planned world
+
+    job is (params,seed,start,descents,end,z), where params are the
+    world's key_params and start/descents/end its planned stairs.
+    Returns (z,grid,waypoints,history) for floor z.
+    """
+    params,seed,start,descents,end,z = job
+
+    gen = WorldGenerator(silent=True,seed=seed,lazy=True,**params)
+    gen.start = start
+    gen.descents = list(descents)
+    gen.end = end
+
+    grid = gen.generate_floor(z)
+    return z,grid,gen.floor_ways[z],gen.history
+
+def generate_world(job):
+    """ Batch worker, generates and saves one world
+
+    job is (index,seed,fpath,fmt,params,cache_dir), where fmt is
+    'template', 'binary' or 'rle', params are WorldGenerator keyword arguments
+    and cache_dir is a WorldCache path or None.
+    Returns (index,seed,fpath,wall time,cpu time).
+    """
+    index,seed,fpath,fmt,params,cache_dir = job
+
+    wall = time.time()
+    cpu = time.clock()
+    if cache_dir is None:
+        world = WorldGenerator(seed=seed,**params)
+    else:
+        from world_cache import WorldCache
+        world = WorldCache(cache_dir).world(seed=seed,**params)
+    world.save(fpath,fmt)
+
+    return index,seed,fpath,time.time()-wall,time.clock()-cpu
+
 class WorldGenerator:
 
     """ Generates worlds based on the config parameters """
 
+    # Constructor arguments that change the generated world, together
+    # with the seed they identify it (see world_cache.WorldCache)
+    key_params = (
+                'dim_x','dim_y','dim_z','flex_limit',
+                'room_variance','post_check','path_alg',
+                'corridor_jitter','corridor_loops','layout'
+                )
+
+    layouts = ('halls','caves','bsp')   # Floor layout styles
+
     def __init__(
                 self,           # World Generator
                 debug=False,    # Debug mode
@@ -33,7 +98,14 @@ class WorldGenerator:
                 app_logger=None,# Optional passed logger
                 room_variance=2,# Room size variance
                 post_check=False,# Automatic post-generation check
-                path_alg='gbf_search'   # Path testing algorithm
+                path_alg='gbf_search',  # Path testing algorithm
+                seed=None,      # Random seed (None = pick one)
+                lazy=False,     # Plan stairs only, build floors on demand
+                workers=1,      # Floor worker processes (0 = all cores)
+                corridor_jitter=0.3,# Hallway bend rate (0..1)
+                corridor_loops=0.0, # Extra hallway loop rate (0..1)
+                layout='halls', # Floor layout style, see layouts
+                profile=False   # Collect phase timings (see profiler)
                 ):
         """ WorldGenerator creates a world_template """
 
@@ -54,11 +126,36 @@ class WorldGenerator:
         # waypoints of varying sizes (control by setting room_variance),
         # and a pathfinding algorithm ensures each level is passable before
         # being returned.
+        #
+        # Every world draws from its own random.Random streams, derived
+        # from seed, so a (parameters,seed) pair always yields the same
+        # world.  Stairs are planned from one stream, then each floor is
+        # built from a stream of its own (see build_floor), so a floor
+        # comes out the same whether it is built alone or with the rest.
+        #
+        # With lazy set, only the stairs are planned and no grid is
+        # allocated; floors are built one at a time by generate_floor()
+        # (see world_stream.StreamingWorld).
+        #
+        # With workers other than 1, floors are built in parallel on a
+        # process pool once the stairs are planned, then copied into the
+        # grid.  The result is identical to a serial build.
+        #
+        # With profile set, self.profiler collects wall and CPU time per
+        # generation phase, hot function call counts and peak memory
+        # (profiler.Profiler.report).  Floors built by pool workers are
+        # timed as a whole, under 'floors'.
 
         start = time.clock()
         self.history = []
         self.silent = silent
 
+        if seed is None:
+            seed = random.randint(0,sys.maxint)
+        self.seed = seed
+        self.stair_rng = random.Random(seed)
+        self.rng = self.stair_rng
+
         if app_logger is None:
             # Enable verbose messages if in debug or verbose mode
             if debug or verbose:
@@ -73,11 +170,13 @@ class WorldGenerator:
         else:
             self.logger = app_logger
             self.logger.info('[*] Logger received')
-
+        self.log_debug = self.logger.isEnabledFor(logging.DEBUG)
+        self.profiler = Profiler() if profile else null_profiler
 
         # Designate bottom floor as boss level
         self.boss_level = dim_z     # Boss on lowest level
         self.logger.debug('\tBoss on {}'.format(self.boss_level))
+        self.logger.debug('\tSeed : {}'.format(self.seed))
 
         self.logger.debug("\tdim_x={}".format(dim_x))
         self.logger.debug("\tdim_y={}".format(dim_y))
@@ -86,68 +185,122 @@ class WorldGenerator:
         self.dim_y = int(dim_y)
         self.dim_z = int(dim_z)
         self.post_done = False  # Flag to indicate post-generation path check
+        self.flex_limit = flex_limit
+        self.room_variance = room_variance
+        self.post_check = post_check
+        self.path_alg = path_alg
+        self.corridor_jitter = float(corridor_jitter)
+        self.corridor_loops = float(corridor_loops)
+        if layout not in WorldGenerator.layouts:
+            raise ValueError('Unknown layout : {}'.format(layout))
+        self.layout = layout
+        self.workers = workers or multiprocessing.cpu_count()
         self.min_dist = int(((self.dim_x+self.dim_y)/2)*.75)   #3/4 the avg
         self.logger.debug(
                 '\tMinimum waypoint distance : {}'.format(self.min_dist)
                 )
 
-        self.grid = self.erect_walls()    # fill the dict with walls
         self.dims = (dim_x,dim_y,dim_z)
         self.logger.debug(
                 '\tDimensions (x,y,z): ( {}, {}, {} )'.format(*self.dims)
                 )
 
+        self.descents = []      # Descent point of each floor, planned
+        self.end = None
+        self.floor_ways = {}    # Waypoints of each built floor
+        self.floor_revs = {}    # Times each floor was regenerated
+        self.floor_undo = {}    # z -> [(snapshot,waypoints,revision)]
+
+        self.logger.info('[*] Generating waypoints')
+        with self.profiler.phase('stairs'):
+            self.set_entry_point()
+
+        if lazy:
+            self.grid = None
+            self.logger.info('[*] Lazy mode, floors built on demand')
+            return
+
         # Map Generation Functions
         self.logger.info('[*] Generating map template')
+        with self.profiler.phase('walls'):
+            self.grid = self.erect_walls()    # fill the grid with walls
 
-        self.logger.info('[*] Generating waypoints')
-        self.set_entry_point()
-        self.set_descent_point()
-        self.set_exit_point()
+        with self.profiler.phase('stairs'):
+            self.set_descent_point()
+            self.set_exit_point()
 
         self.logger.info('[*] Filling map content')
-        self.build_paths()
-        self.build_rooms()
+        with self.profiler.phase('floors'):
+            self.build_floors()
 
         if post_check:
             self.logger.info('[*] Testing map pathing')
-            self.test_paths()
+            with self.profiler.phase('post_check'):
+                self.test_paths()
 
         self.logger.info('[*] Map generation complete')
         self.logger.debug('\tTook {}s'.format(time.clock()-start))
 
+    def __getstate__(self):
+        # Loggers don't pickle, __setstate__ attaches a fresh one
+        state = self.__dict__.copy()
+        del state['logger']
+        return state
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self.logger = logging.getLogger(__name__)
+        self.log_debug = self.logger.isEnabledFor(logging.DEBUG)
+
     def __str__(self):
-        retval = ''
-        for z in range(0,self.dim_z+1):
-            retval+='\tFloor -{0}-\n'.format(z)
-            for y in range(0,self.dim_y):
-                for x in range(0,self.dim_x):
-                    if self.grid[x,y,z][0]==WorldTile.wall:
-                        retval += '. '
-                    else:
-                        retval += '.'
-                        if self.grid[x,y,z][1] is not None:
-                            retval+=color(
-                                    '{0}'.format(self.grid[x,y,z][0]),
-                                    self.grid[x,y,z][1]
-                                    ).colorized
-                        else:
-                            retval+= '{0}'.format(self.grid[x,y,z][0])
-                retval+='\n'
+        return WorldRenderer(self.grid).render(range(0,self.dim_z+1))
 
-        return retval
+    def map_template(self,floors=None):
+        """ Returns the grid as map_template python source """
+
+        if floors is None:
+            floors = self.dim_z+1
 
-    def erect_walls(self):
-        grid = {}
+        o = 'map_template = (\n'
+        for z in range(floors):
+            o += '  (\n'
+            for y in range(self.dim_y):
+                o += '    ({}),\n'.format(','.join(self.grid.row(y,z)))
+            o += '  ),\n'
+
+        o += ')\n'
+        return o
+
+    def save(self,fpath,fmt='template',floors=None):
+        """ Writes the grid to fpath as a map_template, binary or RLE map """
+        if fmt=='binary':
+            from map_format import write_map
+            write_map(self.grid,fpath,floors)
+        elif fmt=='rle':
+            import rle
+            rle.save(self.grid,fpath,floors)
+        elif fmt=='template':
+            with open(fpath,'w') as outfile:
+                outfile.write(self.map_template(floors))
+        else:
+            raise ValueError('Unknown map format : {}'.format(fmt))
 
+    def erect_walls(self,base_z=0,floors=None):
         start = time.clock()
         self.logger.info('[*] Building walls')
 
-        for z in range(0,self.dim_z+1):
-            for y in range(0,self.dim_y):
-                for x in range(0,self.dim_x):
-                    # Grid format [tile_value,color(None if normal color)]
-                    grid[x,y,z]=[WorldTile.wall,None]
+        if floors is None:
+            floors = self.dim_z+1-base_z
+
+        # Grid format [tile_value,color(None if normal color)]
+        grid = WorldGrid(
+                        self.dim_x,self.dim_y,floors,
+                        WorldTile.wall,base_z
+                        )
+
+        # Track stairs and exits so locating them never scans a floor
+        for tile_type in WorldTile.stairs:
+            grid.index_tile(tile_type)
 
         self.logger.debug('\tFilled {} tiles'.format(len(grid)))
         self.logger.debug('\tTook {}s'.format(time.clock()-start))
@@ -161,374 +314,393 @@ class WorldGenerator:
         self.logger.info('[*] Setting entry point')
 
         z = 0   # Entry point is on first floor
-        valid_x = range(1,self.dim_x-1) # valid values (OR w/valid_y)
-        valid_y = range(1,self.dim_y-1)
-
-        self.logger.debug('\tvalid_x range : {}'.format(valid_x))
-        self.logger.debug('\tvalid_y range : {}'.format(valid_y))
-
-        iterations = 0
-        while True:
-            x_test = random.randint(0,self.dim_x)
-            y_test = random.randint(0,self.dim_y)
+        pt = sample_far(self.stair_rng,edge_segments(self.dim_x,self.dim_y))
+        if pt is None:
+            raise PlacementError('No edge tiles on a {}x{} floor'.format(
+                                                        self.dim_x,self.dim_y
+                                                        ))
 
-            if x_test in valid_x and y_test not in valid_y:
-                condition = True
-            elif y_test in valid_y and x_test not in valid_x:
-                condition = True
-            else:
-                condition = False
-
-            if condition:
-                self.grid[x_test,y_test,z]=[
-                                            WorldTile.entry_point,
-                                            [color.GREEN,color.BOLD]
-                                            ]
-
-                self.start = (x_test,y_test,z)
-                self.logger.debug('\tEntry point set : {0}'.format((
-                                                        x_test,y_test,z
-                                                        )))
-                break
-            iterations += 1
-
-        self.logger.debug('\tEntry point took {} attempts'.format(iterations))
+        self.start = (pt[0],pt[1],z)
+        self.logger.debug('\tEntry point set : {0}'.format(self.start))
         self.logger.debug('\tTook {}s'.format(time.clock()-start))
 
-    def set_descent_point(self):
-        """ Sets point to descend/ascend on each level """
+    def place_far(self,segments,anchor,name):
+        """ Draws a point of segments at least min_dist from anchor
+
+        Falls back to the farthest point, and reports it, when the
+        constraint cannot be met.
+        """
+        pt = sample_far(self.stair_rng,segments,anchor,self.min_dist)
+        if pt is None:
+            pt = farthest(segments,anchor)
+            self.logger.error(
+                '[*] No {} at distance {} from {}, using {}'.format(
+                                        name,self.min_dist,anchor[:2],pt
+                                        ))
+        return pt
+
+    def set_descent_point(self,floor=None):
+        """ Plans the point to descend/ascend on each level
+
+        Floors are planned in order up to floor (default: the floor
+        above the bottom), so lazy worlds only plan what they reach.
+        """
+
+        if floor is None:
+            floor = self.dim_z-1
+        floor = min(floor,self.dim_z-1)
+        if len(self.descents)>floor:
+            return
 
         self.logger.info('[*] Setting descent points')
         start = time.clock()
 
-        i = 0
-        while i < self.dim_z: # Loop until bottom floor
-            x_test = random.randint(0,self.dim_x-1)
-            y_test = random.randint(0,self.dim_y-1)
-
-            if i==0:
-                tile_type = WorldTile.entry_point
-            else:
-                tile_type = WorldTile.ascent_point
-
-            check_point = self.find_tile(i,tile_type)
-
-            assert check_point, 'Tile Not Found! lvl {0}:{1}\n{2}'.format(
-                                                            i,
-                                                            tile_type,
-                                                            self
-                                                            )
-
-            if self.calc_dist(check_point,(x_test,y_test))>=self.min_dist:
-                # If the distance is acceptable, set the points
-                # and move to next level :
-
-                # Add a descent point in the grid template
-                self.grid[x_test,y_test,i]=[
-                                    WorldTile.descent_point,
-                                    [color.CYAN,color.BOLD]
-                                    ]
-                self.logger.debug(
-                       '\tDescent Point Set {0}'.format((x_test,y_test,i))
-                       )
-
-                # Add corresponding ascent point on the next floor
-                self.grid[x_test,y_test,i+1]=[
-                                    WorldTile.ascent_point,
-                                    [color.RED,color.BOLD]
-                                    ]
-                self.logger.debug(
-                       '\tAscent Point Set {0}'.format((x_test,y_test,i+1))
-                       )
-                i += 1
+        segments = floor_segments(self.dim_x,self.dim_y)
+        for i in range(len(self.descents),floor+1):
+            # The ascent point on the next floor shares the descent
+            # point's x,y
+            x,y = self.place_far(segments,self.floor_start(i),'descent point')
+            self.descents.append((x,y,i))
+            self.logger.debug('\tDescent Point Set {0}'.format((x,y,i)))
 
         self.logger.debug('\tTook {}s'.format(time.clock()-start))
 
-    def path_avail_dirs(self,position,impediments,dest=None,rand=False):
-        # Processes available directions, returns a random direction
-        # if the random flag is passed, else returns the direction
-        # list
+    def floor_start(self,z):
+        """ Returns the planned entry or ascent point of floor z """
+        if z == 0:
+            return self.start
+        self.set_descent_point(z-1)
+        x,y,dz = self.descents[z-1]
+        return (x,y,z)
+
+    def floor_end(self,z):
+        """ Returns the planned descent or exit point of floor z """
+        if z == self.dim_z:
+            if self.end is None:
+                self.set_exit_point()
+            return self.end
+        self.set_descent_point(z)
+        return self.descents[z]
+
+    def place_stairs(self,z):
+        """ Writes floor z's planned stairs and exits into the grid """
+        if z == 0:
+            self.grid[self.start]=[
+                                WorldTile.entry_point,
+                                [color.GREEN,color.BOLD]
+                                ]
+        else:
+            self.grid[self.floor_start(z)]=[
+                                WorldTile.ascent_point,
+                                [color.RED,color.BOLD]
+                                ]
+
+        if z == self.dim_z:
+            self.grid[self.floor_end(z)]=[
+                                WorldTile.exit_point,
+                                [color.GREEN,color.BOLD]
+                                ]
+        else:
+            self.grid[self.floor_end(z)]=[
+                                WorldTile.descent_point,
+                                [color.CYAN,color.BOLD]
+                                ]
 
-        self.logger.debug('[*] Finding available directions')
+    def calc_dist(self,pt1,pt2):
+        x_term = pt1[0]-pt2[0]
+        y_term = pt1[1]-pt2[1]
+        return math.sqrt(x_term**2+y_term**2)
 
-        imp = ''.join(str(i) for i in impediments)
-        self.logger.debug('\tImpediments : {}'.format(imp))
+    def find_tile(self,z,tile_type):
+        """ Looks for the given tile type on the requested floor """
+        return self.grid.locate(z,tile_type)
 
-        p = position
-        self.logger.debug('\tPosition : {}'.format(p))
+    def set_exit_point(self):
+        """ Sets exit point on the map edge, far enough from entry """
 
-        # Define directions
-        north = [0,1]
-        south = [0,-1]
-        east = [1,1]
-        west = [1,-1]
+        self.logger.info('[*] Setting exit point')
 
-        if dest is not None:
-            prefer_y = [True] if p[0]==dest[0] else [False]
-            prefer_x = [True] if p[1]==dest[1] else [False]
+        asc = self.floor_start(self.dim_z)
+        self.logger.debug('\tAscent point found : {}'.format(asc))
+        segments = edge_segments(self.dim_x,self.dim_y)
+        if not segments:
+            raise PlacementError('No edge tiles on a {}x{} floor'.format(
+                                                        self.dim_x,self.dim_y
+                                                        ))
 
-            if p[0]<dest[0] and prefer_x: prefer_x.append(1)
-            if p[0]>dest[0] and prefer_x: prefer_x.append(-1)
-            if p[1]<dest[1] and prefer_y: prefer_y.append(1)
-            if p[1]>dest[1] and prefer_y: prefer_y.append(-1)
+        x,y = self.place_far(segments,asc,'exit point')
+        self.end = (x,y,self.dim_z)
+        self.logger.debug('\tExit Point Set {0}'.format(self.end))
+        return True
 
-            # Reduce compared value for more direct paths
-            if random.randint(0,100)>30:
-                apply_preference=True
-            else:
-                apply_preference=False
+    def build_floors(self):
+        """ Builds every floor of the grid """
 
-        # impediments will contain impassable vals
-        # x-axis
-        if p[0]+1>=self.dim_x:
-            north.append(False)
+        floors = range(self.grid.base_z,self.grid.base_z+self.grid.floors)
+        if self.workers>1 and len(floors)>1:
+            self.build_floors_parallel(floors)
         else:
-            north.append(
-                True if self.grid[p[0]+1,p[1],p[2]][0] not in imp else False
-                )
+            for z in floors:
+                self.build_floor(z)
 
-        if p[0]-1<=0:
-            south.append(False)
-        else:
-            south.append(
-                True if self.grid[p[0]-1,p[1],p[2]][0] not in imp else False
-                )
+        self.list_waypoints()
 
-        # y-axis
-        if p[1]+1>=self.dim_y:
-            east.append(False)
-        else:
-            east.append(
-                True if self.grid[p[0],p[1]+1,p[2]][0] not in imp else False
-                )
-        if p[1]-1<=0:
-            west.append(False)
-        else:
-            west.append(
-                True if self.grid[p[0],p[1]-1,p[2]][0] not in imp else False
-                )
+    def list_waypoints(self):
+        """ Rebuilds way_list from the waypoints of every floor """
+        self.way_list = []
+        for z in sorted(self.floor_ways):
+            self.way_list.extend(self.floor_ways[z])
 
-        dirs = [north,south,east,west]
-        assert any(dirs),'Pathbuilder : No available moves!'
-
-        if not rand:
-            return dirs
-        elif apply_preference and (prefer_x or prefer_y):
-            if prefer_x[0]:
-                self.logger.debug('\tPreferring x : {}'.format(prefer_x[1]))
-                return 0,prefer_x[1]
-            elif prefer_y:
-                self.logger.debug('\tPreferring y : {}'.format(prefer_y[1]))
-                return 1,prefer_y[1]
-        else:
-            # Randomly selects an available move and returns it
-            while True:
-                roll = random.randint(0,3)
-                dirs = [north,south,east,west]
-                if dirs[roll][2]:
-                    if roll in [0,1]:
-                        idx = 0
-                        val = 1 if roll==0 else -1
-                    else:
-                        idx = 1
-                        val = 1 if roll==2 else -1
-                    break
-
-            self.logger.debug('\tindex (x,y)= {} value= {}'.format(idx,val))
-            return idx,val
+    def build_floors_parallel(self,floors):
+        """ Builds floors on a process pool, then copies them in """
 
-    def calc_dist(self,pt1,pt2):
-        x_term = pt1[0]-pt2[0]
-        y_term = pt1[1]-pt2[1]
-        return math.sqrt(x_term**2+y_term**2)
+        start = time.time()
+        self.logger.info('[*] Building {} floors on {} workers'.format(
+                                                len(floors),
+                                                min(self.workers,len(floors))
+                                                ))
 
-    def find_tile(self,z,tile_type):
-        """ Looks for the given tile type on the requested floor """
-        retval = False
-        for y in range(self.dim_y):
-            for x in range(self.dim_x):
-                if tile_type==self.grid[x,y,z][0]:
-                    retval = (x,y,z)
+        # Plan every stair before the floors split up
+        self.set_descent_point()
+        self.floor_end(self.dim_z)
 
-        return retval
+        params = dict((name,getattr(self,name)) for name in self.key_params)
+        params['post_check'] = False
+        job_list = [
+                (params,self.seed,self.start,self.descents,self.end,z)
+                for z in floors
+                ]
 
-    def set_exit_point(self):
-        """ Sets exit point on the map edge, far enough from entry """
+        histories = {}
+        pool = multiprocessing.Pool(min(self.workers,len(floors)))
+        try:
+            for z,grid,ways,history in pool.imap_unordered(
+                                                    build_floor_job,
+                                                    job_list
+                                                    ):
+                self.grid.put_floors(grid)
+                self.floor_ways[z] = ways
+                histories[z] = history
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
 
-        valid_x = range(1,self.dim_x-1)
-        valid_y = range(1,self.dim_y-1)
-        max_attempts = 500
-        this_attempt = 0
+        for z in floors:
+            self.history.extend(histories[z])
 
-        self.logger.info('[*] Setting exit point')
-        self.logger.debug('\tvalid_x range : {}'.format(valid_x))
-        self.logger.debug('\tvalid_y range : {}'.format(valid_y))
-
-        while True:
-            x_test = random.randint(0,self.dim_x-1)
-            y_test = random.randint(0,self.dim_y-1)
-            if x_test in valid_x and y_test not in valid_y:
-                condition = True
-            elif y_test in valid_y and x_test not in valid_x:
-                condition = True
-            else:
-                condition = False
-
-            if condition:
-                asc = self.find_tile(self.dim_z-1,WorldTile.ascent_point)
-
-                assert asc,'Ascent point not found! {0}\n{1}'.format(
-                                                            self.dim_z,
-                                                            self)
-                self.logger.debug('\tAscent point found : {}'.format(asc))
-                test = (x_test,y_test,self.dim_z)
-                if self.calc_dist(asc,test)>=self.min_dist:
-                    self.grid[test]=[
-                                    WorldTile.exit_point,
-                                    [color.GREEN,color.BOLD]
-                                    ]
-                    self.end = test
-                    self.logger.debug(
-                           '\tExit Point Set {0}'.format(tuple(test)
-                           ))
-                    return True
-                    break
-
-            this_attempt += 1
-
-            if this_attempt >= max_attempts:
-                again = raw_input('Max attempts reached, continue(y)?')
-                if again not in ['y','Y']:
-                    return False
-                    break
-                else:
-                    this_attempt = 0
-
-    def build_paths(self):
-        """ Builds paths of hallways to waypoints """
+        self.logger.debug('\tTook {}s'.format(time.time()-start))
+
+    def build_floor(self,z):
+        """ Builds floor z's stairs, hallways and rooms into the grid """
+
+        rev = self.floor_revs.get(z,0)
+        if rev:
+            self.rng = random.Random(derive_seed(self.seed,'floor',z,rev))
+        else:
+            self.rng = random.Random(derive_seed(self.seed,'floor',z))
+        if self.layout=='caves':
+            with self.profiler.phase('caves'):
+                self.build_cave(z)
+        elif self.layout=='bsp':
+            with self.profiler.phase('bsp'):
+                self.build_bsp(z)
+        else:
+            self.place_stairs(z)
+            with self.profiler.phase('paths'):
+                self.build_paths(z)
+            with self.profiler.phase('rooms'):
+                self.build_rooms(z)
+
+    def build_cave(self,z):
+        """ Builds floor z as caves, linked to its stairs by hallways """
+
+        self.grid.load_floor(z,cave_floor(
+                                        self.dim_x,self.dim_y,self.rng,
+                                        WorldTile.wall,WorldTile.dungeon
+                                        ))
+        self.place_stairs(z)
+
+        # Hallways through the rock join the stairs and waypoints, so
+        # the caves they cross are connected too
+        self.build_paths(z)
+        for pt in self.find_path_ends(z):
+            self.create_room(WorldTile.dungeon,pt,1)
+
+        self.fill_pockets(z)
+
+    def build_bsp(self,z):
+        """ Builds floor z as partitioned rooms joined by short hallways """
+
+        rooms,links = partition(self.dim_x,self.dim_y,self.rng)
+        self.logger.debug('\tFloor {} : {} rooms'.format(z,len(rooms)))
+
+        # Rooms never overlap, so they are stamped without a mask
+        self.profiler.count('stamp',len(rooms))
+        for x0,y0,x1,y1 in rooms:
+            self.grid.stamp(WorldTile.dungeon,None,(x0,y0),(x1,y1),z)
+        for a,b in links:
+            self.connect(a+(z,),b+(z,))
+
+        self.place_stairs(z)
+        start,end = self.find_path_ends(z)
+        centers = [room_center(room)+(z,) for room in rooms]
+
+        # Stairs join the nearest room, or each other on floors too
+        # small to hold one
+        for pt in (start,end):
+            if centers:
+                self.connect(pt,min(
+                                centers,
+                                key=lambda c: abs(c[0]-pt[0])+abs(c[1]-pt[1])
+                                ))
+            self.create_room(WorldTile.dungeon,pt,1)
+        if not centers:
+            self.connect(start,end)
+
+        self.floor_ways[z] = [start]+centers+[end]
+
+    def fill_pockets(self,z):
+        """ Walls up every part of floor z unreachable from its start """
+        labels = self.floor_labels(z)
+        keep = labels.label(self.floor_start(z))
+        filled = 0
+        for label,y,a,b in labels.runs:
+            if label!=keep:
+                self.grid.fill(WorldTile.wall,None,(a,y,z),(b,y+1,z+1))
+                filled += b-a
+        self.logger.debug('\tFilled {} unreachable tiles'.format(filled))
+
+    def regenerate_floor(self,z):
+        """ Rebuilds floor z alone, keeping its stairs where they are
+
+        The old floor is snapshotted first, so restore_floor() can put
+        it back.  Returns True if the new floor is fully connected.
+        """
+        start = time.clock()
+        self.logger.info('[*] Regenerating floor {}'.format(z))
+
+        self.floor_undo.setdefault(z,[]).append((
+                                            self.grid.snapshot(z),
+                                            self.floor_ways.get(z),
+                                            self.floor_revs.get(z,0)
+                                            ))
+
+        # Each regeneration draws from a fresh stream of its own, so
+        # the result still only depends on seed and history
+        self.floor_revs[z] = self.floor_revs.get(z,0)+1
+        with self.profiler.phase('regenerate'):
+            self.grid.fill(
+                        WorldTile.wall,None,
+                        (0,0,z),(self.dim_x,self.dim_y,z+1)
+                        )
+            self.build_floor(z)
+        self.list_waypoints()
+        self.post_done = False
+
+        missing = self.validate([z])
+        if missing:
+            self.logger.error('[*] Floor {} is not connected'.format(z))
+        self.logger.debug('\tTook {}s'.format(time.clock()-start))
+        return not missing
+
+    def restore_floor(self,z):
+        """ Undoes the last regenerate_floor(z), returns False if none """
+        try:
+            snapshot,ways,rev = self.floor_undo[z].pop()
+        except (KeyError,IndexError):
+            return False
+
+        self.logger.info('[*] Restoring floor {}'.format(z))
+        self.grid.restore(snapshot)
+        self.floor_ways[z] = ways
+        self.floor_revs[z] = rev
+        self.list_waypoints()
+        return True
+
+    def generate_floor(self,z):
+        """ Builds floor z alone, returns it as a single-floor grid """
+        self.grid = self.erect_walls(z,1)
+        self.build_floor(z)
+        return self.grid
+
+    def build_paths(self,z):
+        """ Builds paths of hallways to waypoints on floor z """
 
         waypoints_per_floor = ((self.dim_x+self.dim_y)/2)/2
         self.logger.debug(
             '\tWaypoint density : {0}'.format(waypoints_per_floor)
             )
-        self.way_list = self.build_waypoints(waypoints_per_floor)
-
-        for i in range(len(self.way_list)-1):
-            way1 = self.way_list[i]
-            way2 = self.way_list[i+1]
-
-            # If the two waypoints are on the same floor,
-            # connect them
-            if way1[2]==way2[2]:
-                self.logger.info('[*] Connecting {0} to {1}'.format(way1,way2))
-                self.connect(way1,way2)
+        ways = self.build_waypoints(waypoints_per_floor,z)
+        self.floor_ways[z] = ways
+
+        # Hallways follow a minimum spanning tree of the waypoints, plus
+        # the odd loop when corridor_loops is set
+        self.profiler.count('link_plan')
+        for i,j in link_plan(ways,self.rng,self.corridor_loops):
+            way1 = ways[i]
+            way2 = ways[j]
+            self.logger.info('[*] Connecting {0} to {1}'.format(way1,way2))
+            self.connect(way1,way2)
 
     def connect(self,pt1,pt2):
         """ Connects the two points with hallway tiles """
 
-        tile_list = []  # List of tiles to be set
+        self.profiler.count('connect')
+
         self.history.append(pt1)    # Append to the history
-        coord_list = list(pt1)  # create a mutable coord list
-
-        max_loops = 35      # Max loops per leg
-        this_loop = 0
-
-        while True:
-            # Pathbuilder exit conditions:
-            if this_loop >= max_loops:
-                self.logger.debug('\tMaximum steps for this leg (pathbuilder)')
-                break
-            if tuple(coord_list)==pt2:
-                # Arrived at destination waypoint
-                self.logger.debug('\tArrived at point {}'.format(pt2))
-                break
-
-            # Final leg detector - executes when a point is reached
-            # on the same axis (x/y) and within 2 tiles.  Directly
-            # connects to the endpoint
-            if coord_list[0]==pt2[0] and abs(coord_list[1]-pt2[1])<3:
-                idx = 1     # axis of motion = x
-                rng = coord_list[1]-pt2[1]
-            elif coord_list[1]==pt2[1] and abs( coord_list[0]-pt2[0])<3:
-                idx = 0     # axis of motion = x
-                rng = coord_list[0]-pt2[0]
-            else:
-                rng = False
-
-            if rng:
-                self.logger.debug('\tDestination point in range')
-                for n in range(rng):
-                    coord_list[idx]+=n
-                    tile_list.append(tuple(coord_list))
-                break
-            # If not the final leg, randomly select a direction
-            idx,val = self.path_avail_dirs(
-                                coord_list,
-                                ['E','U','D','3'],
-                                pt2,
-                                True)
-            coord_list[idx]+=val
-            tile_list.append(tuple(coord_list))
-            this_loop +=1
+
+        # A shortest staircase path, so the leg always arrives in
+        # exactly |dx|+|dy| steps; corridor_jitter sets how often it bends
+        tile_list = corridor(pt1,pt2,self.rng,self.corridor_jitter)
+        self.profiler.count('corridor_tiles',len(tile_list))
+        if self.log_debug:
+            self.logger.debug('\tArrived at point {}'.format(pt2))
 
         # Fill the resulting point list with hallways in the grid
-        for tile in tile_list:
-            try:
-                if self.grid[tile][0]==WorldTile.wall:
-                    self.grid[tile]=[
-                                    WorldTile.hallway,
-                                    [color.BLUE,color.BOLD]
-                                    ]
-            except KeyError:
-                if not self.silent:
-                    self.logger.error('[*] Invalid tile specified!')
-                self.logger.debug('Tile value : {}'.format(tile))
-                continue
+        invalid = self.grid.carve(
+                                tile_list,
+                                WorldTile.hallway,
+                                [color.BLUE,color.BOLD],
+                                (WorldTile.wall,)
+                                )
+        for tile in invalid:
+            if not self.silent:
+                self.logger.error('[*] Invalid tile specified!')
+            self.logger.debug('Tile value : {}'.format(tile))
+
+    def build_waypoints(self,w,z):
+        """ Returns floor z's start, w spread out waypoints and end """
+
+        start,end = self.find_path_ends(z)
+
+        # Waypoints keep a Poisson-disc spacing from each other and the
+        # stairs, sized so w of them fit the floor comfortably
+        area = (self.dim_x-1)*(self.dim_y-1)
+        radius = math.sqrt(area/(2.0*max(w,1)))
+        sampler = PoissonDisc(
+                            (1,1),(self.dim_x-1,self.dim_y-1),
+                            radius,self.rng
+                            )
+        sampler.add(start)
+        sampler.add(end)
+        self.profiler.count('poisson_sample')
+        ways = [(x,y,z) for x,y in sampler.sample(w)]
 
-    def build_waypoints(self,w):
-        retval = []
-        for z in range(self.dim_z+1):
-            # Set starting waypoint for the floor
-            if z == 0:
-                retval.append(self.start)
-            else:
-                retval.append(self.find_tile(z,WorldTile.ascent_point))
-
-            # Fill other waypoints
-            dbg_string = 'Floor {} waypoints :\n\t'.format(z)
-            for way in range(w):
-                x = random.randint(1,self.dim_x-1)
-                y = random.randint(1,self.dim_y-1)
-
-                if len(retval)%4==0:
-                    dbg_string += '{}\n\t'.format((x,y,z))
-                else:
-                    dbg_string += '{0},'.format((x,y,z))
-
-                retval.append((x,y,z))
-            dbg_string = dbg_string[:-1]
-            self.logger.debug(dbg_string)
-
-            # Set ending waypoint for the floor
-            if z == self.dim_z:
-                retval.append(self.end)
-            else:
-                retval.append(self.find_tile(z,WorldTile.descent_point))
-        return retval
+        if len(ways)<w:
+            self.logger.error('[*] Only {} of {} waypoints fit floor {}'\
+                              .format(len(ways),w,z))
+        if self.log_debug:
+            self.logger.debug('\tFloor {} waypoints : {} (spacing {:.2f})'\
+                              .format(z,ways,sampler.radius))
+
+        return [start]+ways+[end]
 
     def find_path_ends(self,z):
         """ Returns the endpoints for the given floor """
-        if z == 0:
-            start = self.find_tile(z,WorldTile.entry_point)
-            end = self.find_tile(z,WorldTile.descent_point)
-        elif z == self.dim_z:
-            start = self.find_tile(z,WorldTile.ascent_point)
-            end = self.find_tile(z,WorldTile.exit_point)
-        else:
-            start = self.find_tile(z,WorldTile.ascent_point)
-            end = self.find_tile(z,WorldTile.descent_point)
-
-        return start, end
+        return self.floor_start(z), self.floor_end(z)
 
     def gen_feature(self,feature):
         if feature=='s_curve':
@@ -536,23 +708,24 @@ class WorldGenerator:
         elif feature=='dead_end':
             pass
 
-    def build_rooms(self):
-        """ Builds rooms off of the paths """
+    def build_rooms(self,z):
+        """ Builds rooms off of the paths on floor z """
 
-        for z in range(0,self.dim_z+1):
-            start, end = self.find_path_ends(z)
-            for pt in (start,end):
-                self.create_room(WorldTile.dungeon,pt,1)
+        start, end = self.find_path_ends(z)
+        for pt in (start,end):
+            self.create_room(WorldTile.dungeon,pt,1)
 
-        for way in self.way_list:
+        for way in self.floor_ways[z]:
             self.create_room(WorldTile.dungeon,way)
 
 
     def create_room(self,fill,center,size=None,color=None):
         """ Creates a rectangle in the approximate size passed, None = random """
 
+        self.profiler.count('create_room')
+
         if size is None:
-            size = random.randint(1,2)
+            size = self.rng.randint(1,2)
 
         # Only allow overwrite of appropriate tiles
         overwrite_allowed = (
@@ -561,69 +734,83 @@ class WorldGenerator:
                             WorldTile.door
                             )
 
-        # Replaces tile contents in a square around the center with fill
-        for x_offset in range(-size,size+1):
-            for y_offset in range(-size,size+1):
-
-                # Eliminate values outside the grid
-                if center[0]+x_offset > self.dim_x-1 or center[0]+x_offset < 0:
-                    x_offset=0
-                if center[1]+y_offset > self.dim_y-1 or center[1]+y_offset < 0:
-                    y_offset=0
-
-                pt = (center[0]+x_offset,center[1]+y_offset,center[2])
-                for tile in overwrite_allowed:
-                    if tile==self.grid[pt][0]:
-                        self.grid[pt]=[fill,color]
+        # Replaces tile contents in a square around the center with fill,
+        # values outside the grid are clipped
+        self.profiler.count('stamp')
+        self.grid.stamp(
+                    fill,
+                    color,
+                    (center[0]-size,center[1]-size),
+                    (center[0]+size,center[1]+size),
+                    center[2],
+                    overwrite_allowed
+                    )
+
+    def floor_labels(self,z):
+        """ Returns the connected components of floor z """
+        self.profiler.count('floor_labels')
+        return FloorLabels(self.grid,z)
+
+    def room_graph(self,floors=None):
+        """ Returns the rooms, corridors and doorways of the world """
+        from room_graph import RoomGraph
+        return RoomGraph(self.grid,floors)
+
+    def validate(self,floors=None):
+        """ Checks every floor's stairs and waypoints share a component
+
+        Returns {z:[unreachable points]} for each disconnected floor, an
+        empty dict when the world is fully connected.
+        """
+        if floors is None:
+            floors = range(self.grid.base_z,self.grid.base_z+self.grid.floors)
+
+        retval = {}
+        for z in floors:
+            start,end = self.find_path_ends(z)
+            points = [start,end]+list(self.floor_ways.get(z,()))
+            missing = self.floor_labels(z).disconnected(points)
+            if missing:
+                retval[z] = missing
+        return retval
 
     def test_paths(self):
         """ Confirms each waypoint is reachable """
 
+        # Reachability comes from one labeling pass per floor, the
+        # pathfinder only traces the start to end path for display
         for z in range(self.dim_z+1):
-            # Create the graph, impediments are walls(0) and locked doors(L)
-
-            imp = []
-
-            this_floor = [None for y in range(self.dim_y)]
-            for y in range(self.dim_y):
-                this_floor[y]=[None for x in range(self.dim_x)]
-                for x in range(self.dim_x):
-                    this_floor[y][x]=self.grid[x,y,z][0]
-
-            graph = GraphGrid(this_floor)
-
-            # Default impediments are wall(0) and locked doors(L)
-            imp=[(a,b) for a,b,c in self.grid if self.grid[a,b,z][0] in [0,'0','L']]
-
-            # Set the list of impassable points
-            graph.impassable = imp
+            labels = self.floor_labels(z)
 
             # Set the floor start and end points
             start,end = self.find_path_ends(z)
+            points = [start,end]+list(self.floor_ways.get(z,()))
 
             self.logger.info('[*] Testing the path from {} to {}'.format(start,
                                                                          end))
 
+            missing = labels.disconnected(points)
+            if missing:
+                self.logger.error('[*] Floor {} is not connected'.format(z))
+                self.logger.debug('\tUnreachable : {}'.format(missing))
+                continue
+
+            # Create the graph, impediments are walls(0) and locked doors(L)
+            graph = GraphGrid.from_world(self.grid,z)
+
             # Initialize the path tester, as a_star for best path
             path_tester=Pathfinder(Pathfinder.gb_first)
             path_tester.g = graph
-            path_tester.start = start[:2]
-            path_tester.dest = end[:2]
-            path = path_tester.execute()
+            path = path_tester.find_path(start[:2],end[:2])
 
             if not path:
-                self.logger.error("Invalid pathfinding algorithm")
+                self.logger.error('[*] No path found on floor {}'.format(z))
             else:
                 for (x,y) in path:
-                    val=path[x,y]
-                    if val is not None:
-                        if self.grid[x,y,z][0] not in ['U','D','S','E']:
-                            self.grid[val[0],val[1],z][1]=[color.WHITE_ON_BLUE]
-                #for x,y in path[1]:
-                    #print 'coord={}'.format(x)
-                    #print 'score={}'.format(y)
-                    #if self.grid[x,y,z][0] not in ['U','D','S','E']:
-                        #self.grid[x,y,z][1]=[color.WHITE_ON_BLUE]
+                    if self.grid[x,y,z][0] not in WorldTile.stairs:
+                        self.grid.set_color((x,y,z),[color.WHITE_ON_BLUE])
+
+        self.post_done = True
 
     def color_test(self):
         """ prints table of formatted text format options """
@@ -654,16 +841,35 @@ class CLInvoker(object):
 
         try:
             self.handle_args()
+            if self.args.batch:
+                self.run_batch()
+                return
+
+            # Profiles time this run, so a cached world would report
+            # nothing or an earlier run's timings
             start = time.clock()
-            self.world = WorldGenerator(
-                        self.args.debug,self.args.silent,self.args.random,
-                        self.args.fpath,self.args.conf,self.args.xdim,
-                        self.args.ydim,self.args.zdim,self.args.elastic,
-                        self.args.verbose,self.logger,self.args.path
-                        )
+            if self.args.cache is None or self.args.profile is not None:
+                self.world = WorldGenerator(
+                            app_logger=self.logger,
+                            seed=self.args.seed,
+                            **self.world_params()
+                            )
+            else:
+                from world_cache import WorldCache
+                self.world = WorldCache(self.args.cache,
+                                        app_logger=self.logger).world(
+                                            seed=self.args.seed,
+                                            app_logger=self.logger,
+                                            **self.world_params()
+                                            )
             self.logger.debug('\tWorld generation took {}s'.format(
                                                         time.clock()-start
                                                         ))
+            if self.args.profile is not None:
+                self.world.profiler.save(self.args.profile)
+                self.logger.info('[*] Profile written to {}'.format(
+                                                        self.args.profile
+                                                        ))
             while True:
                 self.menu()
 
@@ -680,6 +886,7 @@ class CLInvoker(object):
                 ('[C]heck level paths ({})'.format(post),'c',
                                                     self.world.test_paths),
                 ('[R]egenerate','r',self.regenerate),
+                ('[U]ndo floor regeneration','u',self.undo_floor),
                 ('[S]ave ({})'.format(self.args.fpath),'s',self.save_map),
                 ('[Q]uit','q',sys.exit)
                 ]
@@ -701,38 +908,141 @@ class CLInvoker(object):
         print self.world
 
     def regenerate(self):
+        floor = self.ask_floor('Floor to regenerate (blank = all) > ')
+        if floor is not None:
+            self.world.regenerate_floor(floor)
+            return
+
         try:
             self.world = WorldGenerator(
-                       self.args.debug,self.args.silent,self.args.random,
-                       self.args.fpath,self.args.conf,self.args.xdim,
-                       self.args.ydim,self.args.zdim,self.args.elastic,
-                       self.args.verbose,self.logger,self.args.path
+                       app_logger=self.logger,
+                       **self.world_params()
                        )
         except TypeError:
             self.world = WorldGenerator()
 
-    def save_map(self):
-        """ Saves the map template to a python file, as a 2-tuple """
+    def undo_floor(self):
+        floor = self.ask_floor('Floor to restore > ')
+        if floor is not None and not self.world.restore_floor(floor):
+            print 'Nothing to undo on floor {}'.format(floor)
 
-        self.logger.info('[*] Saving map template')
+    def ask_floor(self,prompt):
+        """ Reads a floor number, None if blank or out of range """
+        ch = raw_input(prompt).strip()
+        if not ch:
+            return None
+        try:
+            floor = int(ch)
+        except ValueError:
+            floor = -1
+        if not 0<=floor<=self.world.dim_z:
+            print 'Invalid floor : ', ch
+            return None
+        return floor
+
+    def world_params(self):
+        """ Returns WorldGenerator keyword arguments from the args """
+        return {
+                'debug':self.args.debug,
+                'silent':self.args.silent,
+                'rand':self.args.random,
+                'fpath':self.args.fpath,
+                'conf':self.args.conf,
+                'dim_x':self.args.xdim,
+                'dim_y':self.args.ydim,
+                'dim_z':self.args.zdim,
+                'flex_limit':self.args.elastic,
+                'verbose':self.args.verbose,
+                'post_check':self.args.path,
+                'workers':self.args.workers,
+                'corridor_jitter':self.args.jitter,
+                'corridor_loops':self.args.loops,
+                'layout':self.args.layout,
+                'profile':self.args.profile is not None
+                }
+
+    def run_batch(self):
+        """ Generates args.batch worlds across a process pool """
+
+        count = self.args.batch
+        jobs = self.args.jobs or multiprocessing.cpu_count()
+        base_seed = self.args.seed
+        if base_seed is None:
+            base_seed = random.randint(0,sys.maxint)
+
+        self.logger.info('[*] Generating {} worlds on {} workers'.format(
+                                                            count,
+                                                            jobs
+                                                            ))
+        self.logger.info('\tBase seed : {}'.format(base_seed))
+
+        # Workers log through their own silent loggers
+        params = self.world_params()
+        params['silent'] = True
+        params['debug'] = False
+        params['verbose'] = False
+
+        # Pool workers can't start pools of their own
+        params['workers'] = 1
+
+        root,ext = os.path.splitext(self.args.fpath)
+        width = len(str(count-1))
+        job_list = [
+                (
+                    i,
+                    derive_seed(base_seed,i),
+                    '{0}_{1:0{2}d}{3}'.format(root,i,width,ext),
+                    self.args.format,
+                    params,
+                    self.args.cache
+                )
+                for i in range(count)
+                ]
 
-        o = 'map_template = (\n'
-        for z in range(int(self.args.zdim)):
-            o += '  (\n'
-            for y in range(int(self.args.ydim)):
-                o += '    ('
-                tmp = ''
-                for x in range(int(self.args.xdim)):
-                    tmp += '{},'.format(self.world.grid[x,y,z][0])
-                o += tmp[:-1]
-                o += '),\n'
-            o += '  ),\n'
+        start = time.time()
+        timings = []
+        pool = multiprocessing.Pool(jobs)
+        try:
+            for i,seed,fpath,wall,cpu in pool.imap_unordered(
+                                                        generate_world,
+                                                        job_list
+                                                        ):
+                timings.append(wall)
+                self.logger.info(
+                    '\tWorld {} (seed {}) -> {} : {:.3f}s wall, {:.3f}s cpu'\
+                    .format(i,seed,fpath,wall,cpu)
+                    )
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        elapsed = time.time()-start
+        self.logger.info('[*] Batch complete : {} worlds in {:.3f}s'.format(
+                                                                count,
+                                                                elapsed
+                                                                ))
+        self.logger.info(
+            '\tPer world : min {:.3f}s, mean {:.3f}s, max {:.3f}s'.format(
+                                            min(timings),
+                                            sum(timings)/len(timings),
+                                            max(timings)
+                                            ))
+        self.logger.info('\tThroughput : {:.2f} worlds/s'.format(
+                                                        count/elapsed
+                                                        ))
 
-        o += ')\n'
+    def save_map(self):
+        """ Saves the map template to a python file, as a 2-tuple,
+            or to a binary (see map_format) or RLE (see rle) map file """
+
+        self.logger.info('[*] Saving map template')
 
+        # Every format holds every floor, 0 to dim_z, as batch runs do
         try:
-            with open(self.args.fpath,'w') as outfile:
-                outfile.write(o)
+            self.world.save(self.args.fpath,self.args.format)
         except:
             self.logger.error('\tFile write failed to {} '.format(
                                                    self.args.fpath
@@ -741,7 +1051,8 @@ class CLInvoker(object):
             self.logger.debug('\tFile written successfully to {}'.format(
                                                         self.args.fpath
                                                         ))
-            self.logger.debug('\tList variable = map_template')
+            if self.args.format=='template':
+                self.logger.debug('\tList variable = map_template')
 
     def handle_args(self):
 
@@ -761,7 +1072,25 @@ class CLInvoker(object):
             ("-z","--zdim","map floor depth",None,3,int),
             ('-e','--elastic','specify flexible dimensions',None,3,int),
             ('-v','--verbose','enable verbose messages','store_true'),
-            ('-p','--path','perform automatic map path validation','store_true')
+            ('-p','--path','perform automatic map path validation','store_true'),
+            ('-S','--seed','random seed (batch : base seed)',None,None,int),
+            ('-b','--batch','generate N worlds non-interactively',None,0,int),
+            ('-j','--jobs','batch worker processes (0 = all cores)',None,0,int),
+            ('-C','--cache','cache generated worlds in this directory',
+                                                            None,None,str),
+            ('-F','--format','output format : template, binary or rle',
+                                                    None,'template',str),
+            ('-w','--workers','floor worker processes (0 = all cores)',
+                                                    None,1,int),
+            ('-J','--jitter','hallway bend rate, 0 (L-shaped) to 1',
+                                                    None,0.3,float),
+            ('-L','--loops','extra hallway loop rate, 0 (tree) to 1',
+                                                    None,0.0,float),
+            ('-l','--layout','floor layout : {}'.format(
+                                        ', '.join(WorldGenerator.layouts)
+                                        ),None,'halls',str),
+            ('-P','--profile','write generation timings to this JSON file',
+                                                            None,None,str)
             ]
 
         # Parse Flags (boolean)
@@ -780,6 +1109,13 @@ class CLInvoker(object):
         self.logger.debug('\tParsing arguments')
         self.args=parser.parse_args()
 
+        if self.args.format not in ('template','binary','rle'):
+            parser.error('invalid format : {}'.format(self.args.format))
+        if self.args.layout not in WorldGenerator.layouts:
+            parser.error('invalid layout : {}'.format(self.args.layout))
+        if self.args.profile is not None and self.args.batch:
+            parser.error('--profile times a single world, not --batch')
+
         # Handle randomization here, if enabled
         if self.args.random:
             self.args.xdim = random.randint(30,50)
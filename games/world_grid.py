@@ -0,0 +1,411 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+class WorldGrid(object):
+
+    """ Array-backed tile storage for WorldGenerator.grid """
+
+    # Tiles are stored as single-byte codes in one contiguous bytearray,
+    # laid out floor by floor, row by row :
+    #
+    #   offset = ((z-base_z)*dim_y + y)*dim_x + x
+    #
+    # Colors live in a parallel bytearray of palette indices.  Index 0
+    # is always None (normal color), so a fresh grid costs 2 bytes per
+    # tile regardless of its contents.
+    #
+    # Reading grid[x,y,z] returns a new [tile_value,color] list, the same
+    # shape the dict-backed grid held, so existing consumers keep working.
+    # Since the list is a copy, colors must be changed with set_color()
+    # rather than by mutating grid[x,y,z][1] in place.
+    #
+    # Registered tile types (see index_tile) are tracked in a position
+    # index that every write keeps current, so locating the stairs on a
+    # floor is a dict lookup instead of a scan of the whole floor.
+    #
+    # fill(), stamp() and carve() write many tiles at once.  Rows are
+    # contiguous, so each row of a region is one slice assignment, and
+    # overwrite masks are applied with bytearray.translate().
+    #
+    # A grid may hold a window of floors starting at base_z, so a single
+    # floor can be generated or stored on its own while keeping the
+    # world's z coordinates.
+
+    max_palette = 256
+
+    def __init__(self,dim_x,dim_y,floors,fill,base_z=0):
+        self.dim_x = int(dim_x)
+        self.dim_y = int(dim_y)
+        self.floors = int(floors)
+        self.base_z = int(base_z)
+        self.floor_size = self.dim_x*self.dim_y
+
+        size = self.floor_size*self.floors
+        self.tiles = bytearray([ord(fill)])*size
+        self.colors = bytearray(size)
+
+        # Palette : index -> color, color key -> index
+        self.palette = [None]
+        self.palette_keys = {None:0}
+
+        # Position index : tile code -> [set of (x,y) per floor]
+        self.index = {}
+
+    def __getstate__(self):
+        # Pickle the arrays as plain strings, much smaller than the
+        # default bytearray reduction
+        state = self.__dict__.copy()
+        state['tiles'] = str(self.tiles)
+        state['colors'] = str(self.colors)
+        return state
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self.tiles = bytearray(self.tiles)
+        self.colors = bytearray(self.colors)
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def __iter__(self):
+        for z in range(self.base_z,self.base_z+self.floors):
+            for y in range(self.dim_y):
+                for x in range(self.dim_x):
+                    yield (x,y,z)
+
+    def __contains__(self,key):
+        try:
+            self.offset(key)
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self,key):
+        i = self.offset(key)
+        return [chr(self.tiles[i]),self.unpack_color(self.colors[i])]
+
+    def __setitem__(self,key,value):
+        i = self.offset(key)
+        tile, color = value
+        code = ord(tile)
+        if self.index:
+            self.reindex(key,self.tiles[i],code)
+        self.tiles[i] = code
+        self.colors[i] = self.palette_index(color)
+
+    def keys(self):
+        return list(self)
+
+    def get(self,key,default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def offset(self,key):
+        """ Returns the array offset of (x,y,z), KeyError if off-grid """
+        x,y,z = key
+        z -= self.base_z
+        if 0<=x<self.dim_x and 0<=y<self.dim_y and 0<=z<self.floors:
+            return (z*self.dim_y+y)*self.dim_x+x
+        raise KeyError(key)
+
+    def floor_index(self,z):
+        """ Returns the position of floor z within this grid """
+        if not self.base_z<=z<self.base_z+self.floors:
+            raise KeyError(z)
+        return z-self.base_z
+
+    def tile(self,key):
+        """ Returns only the tile value at (x,y,z) """
+        return chr(self.tiles[self.offset(key)])
+
+    def color(self,key):
+        """ Returns only the color at (x,y,z) """
+        return self.unpack_color(self.colors[self.offset(key)])
+
+    def set_color(self,key,color):
+        """ Changes the color at (x,y,z), leaving the tile value alone """
+        self.colors[self.offset(key)] = self.palette_index(color)
+
+    def row(self,y,z):
+        """ Returns the tile values of one row as a string """
+        start = self.offset((0,y,z))
+        return str(self.tiles[start:start+self.dim_x])
+
+    def fill(self,tile,color=None,lo=(0,0,0),hi=None):
+        """ Fills the box from lo (inclusive) to hi (exclusive) with tile """
+        if hi is None:
+            hi = (self.dim_x,self.dim_y,self.base_z+self.floors)
+        x0 = max(0,lo[0])
+        y0 = max(0,lo[1])
+        z0 = max(0,lo[2]-self.base_z)
+        x1 = min(hi[0],self.dim_x)
+        y1 = min(hi[1],self.dim_y)
+        z1 = min(hi[2]-self.base_z,self.floors)
+        if x0>=x1 or y0>=y1 or z0>=z1:
+            return
+
+        code = ord(tile)
+        cidx = self.palette_index(color)
+
+        if x0==0 and x1==self.dim_x and y0==0 and y1==self.dim_y:
+            # Whole floors are contiguous, one slice per floor
+            spans = [
+                    (z*self.floor_size,(z+1)*self.floor_size)
+                    for z in range(z0,z1)
+                    ]
+        else:
+            spans = []
+            for z in range(z0,z1):
+                for y in range(y0,y1):
+                    start = (z*self.dim_y+y)*self.dim_x
+                    spans.append((start+x0,start+x1))
+
+        for start,end in spans:
+            if self.index:
+                self.reindex_span(start,end,code)
+            self.tiles[start:end] = bytearray([code])*(end-start)
+            self.colors[start:end] = bytearray([cidx])*(end-start)
+
+    def stamp(self,tile,color,lo,hi,z,allowed=None):
+        """ Sets the rectangle lo..hi (inclusive) on floor z to tile
+
+        The rectangle is clipped to the grid.  If allowed is given, only
+        tiles whose current value is in allowed are overwritten.
+        """
+        x0 = max(0,lo[0])
+        y0 = max(0,lo[1])
+        x1 = min(hi[0],self.dim_x-1)+1
+        y1 = min(hi[1],self.dim_y-1)+1
+        if x0>=x1 or y0>=y1:
+            return
+        if allowed is None:
+            return self.fill(tile,color,(x0,y0,z),(x1,y1,z+1))
+
+        code = ord(tile)
+        cidx = self.palette_index(color)
+        mask = self.overwrite_mask(allowed)
+        table = bytearray(range(256))
+        hits = bytearray(256)       # 1 for overwritable codes
+        for c in range(256):
+            if mask[c]:
+                table[c] = code
+                hits[c] = 1
+        width = x1-x0
+
+        for y in range(y0,y1):
+            start = self.offset((x0,y,z))
+            end = start+width
+            old = self.tiles[start:end]
+            row = old.translate(hits)
+            i = row.find('\x01')
+            if i==-1:
+                continue
+            if self.index:
+                self.reindex_span(start,end,code,mask)
+            self.tiles[start:end] = old.translate(table)
+
+            # Recolor each run of overwritten tiles with one slice
+            while i!=-1:
+                run_end = row.find('\x00',i)
+                if run_end==-1:
+                    run_end = width
+                self.colors[start+i:start+run_end] = \
+                        bytearray([cidx])*(run_end-i)
+                i = row.find('\x01',run_end)
+
+    def carve(self,coords,tile,color=None,allowed=None):
+        """ Sets each (x,y,z) in coords to tile, returns off-grid coords
+
+        If allowed is given, only tiles whose current value is in
+        allowed are overwritten.
+        """
+        code = ord(tile)
+        cidx = self.palette_index(color)
+        mask = self.overwrite_mask(allowed)
+        tiles = self.tiles
+        colors = self.colors
+        invalid = []
+
+        for key in coords:
+            try:
+                i = self.offset(key)
+            except KeyError:
+                invalid.append(key)
+                continue
+            if mask[tiles[i]]:
+                if self.index:
+                    self.reindex(key,tiles[i],code)
+                tiles[i] = code
+                colors[i] = cidx
+
+        return invalid
+
+    def overwrite_mask(self,allowed):
+        """ Returns a 256 entry lookup, true for overwritable codes """
+        if allowed is None:
+            return [True]*256
+        mask = [False]*256
+        for tile_type in allowed:
+            mask[ord(tile_type)] = True
+        return mask
+
+    def reindex_span(self,start,end,code,mask=None):
+        """ Updates the index before tiles[start:end] become code """
+        z = start//self.floor_size
+        for old in self.index:
+            if old==code or (mask is not None and not mask[old]):
+                continue
+            floor = self.index[old][z]
+            if not floor:
+                continue
+            i = self.tiles.find(bytearray([old]),start,end)
+            while i!=-1:
+                rel = i-z*self.floor_size
+                floor.discard((rel%self.dim_x,rel//self.dim_x))
+                i = self.tiles.find(bytearray([old]),i+1,end)
+
+        if code in self.index:
+            floor = self.index[code][z]
+            for i in range(start,end):
+                if mask is None or mask[self.tiles[i]]:
+                    rel = i-z*self.floor_size
+                    floor.add((rel%self.dim_x,rel//self.dim_x))
+
+    def put_floors(self,other):
+        """ Copies every floor of grid other into this grid
+
+        other's floors land at their own z, with colors remapped from
+        other's palette to this one.
+        """
+        if (other.dim_x,other.dim_y)!=(self.dim_x,self.dim_y):
+            raise ValueError('Floor size mismatch : {}x{} into {}x{}'.format(
+                                                other.dim_x,other.dim_y,
+                                                self.dim_x,self.dim_y
+                                                ))
+
+        table = bytearray(256)
+        for idx,color in enumerate(other.palette):
+            table[idx] = self.palette_index(color)
+
+        for z in range(other.base_z,other.base_z+other.floors):
+            zi = self.floor_index(z)
+            src = (z-other.base_z)*other.floor_size
+            dst = zi*self.floor_size
+            self.tiles[dst:dst+self.floor_size] = \
+                    other.tiles[src:src+other.floor_size]
+            self.colors[dst:dst+self.floor_size] = \
+                    other.colors[src:src+other.floor_size].translate(table)
+
+            # Rebuild this floor's index entries from the new tiles
+            for code in self.index:
+                self.index[code][zi] = self.scan_floor(code,zi)
+
+    def load_floor(self,z,tiles,color=None):
+        """ Replaces floor z with tiles, a string of floor_size values """
+        if len(tiles)!=self.floor_size:
+            raise ValueError('Expected {} tiles, got {}'.format(
+                                                self.floor_size,len(tiles)
+                                                ))
+        zi = self.floor_index(z)
+        start = zi*self.floor_size
+        end = start+self.floor_size
+        self.tiles[start:end] = tiles
+        self.colors[start:end] = \
+                bytearray([self.palette_index(color)])*self.floor_size
+
+        for code in self.index:
+            self.index[code][zi] = self.scan_floor(code,zi)
+
+    def snapshot(self,z):
+        """ Returns a frozen copy of floor z, see restore() """
+        zi = self.floor_index(z)
+        start = zi*self.floor_size
+        end = start+self.floor_size
+        return z,str(self.tiles[start:end]),str(self.colors[start:end])
+
+    def restore(self,snapshot):
+        """ Puts a floor back the way snapshot() found it """
+        # Palette indices stay valid, the palette only ever grows
+        z,tiles,colors = snapshot
+        zi = self.floor_index(z)
+        start = zi*self.floor_size
+        end = start+self.floor_size
+        self.tiles[start:end] = tiles
+        self.colors[start:end] = colors
+
+        for code in self.index:
+            self.index[code][zi] = self.scan_floor(code,zi)
+
+    def scan_floor(self,code,zi):
+        """ Returns the set of (x,y) holding code on floor index zi """
+        needle = bytearray([code])
+        start = zi*self.floor_size
+        end = start+self.floor_size
+        found = set()
+        i = self.tiles.find(needle,start,end)
+        while i!=-1:
+            found.add(((i-start)%self.dim_x,(i-start)//self.dim_x))
+            i = self.tiles.find(needle,i+1,end)
+        return found
+
+    def index_tile(self,tile_type):
+        """ Registers tile_type in the position index """
+        code = ord(tile_type)
+        if code in self.index:
+            return
+
+        self.index[code] = [self.scan_floor(code,zi)
+                            for zi in range(self.floors)]
+
+    def reindex(self,key,old,new):
+        """ Moves (x,y,z) between index entries when its tile changes """
+        if old==new:
+            return
+        x,y,z = key
+        z -= self.base_z
+        if old in self.index:
+            self.index[old][z].discard((x,y))
+        if new in self.index:
+            self.index[new][z].add((x,y))
+
+    def positions(self,z,tile_type):
+        """ Returns the set of (x,y) holding tile_type on floor z """
+        self.index_tile(tile_type)
+        return set(self.index[ord(tile_type)][self.floor_index(z)])
+
+    def locate(self,z,tile_type):
+        """ Returns one (x,y,z) holding tile_type on floor z, or False """
+
+        # Unregistered types are indexed on first use, later calls
+        # for the same type are O(1)
+        self.index_tile(tile_type)
+        found = self.index[ord(tile_type)][self.floor_index(z)]
+        if not found:
+            return False
+        elif len(found)==1:
+            x,y = next(iter(found))
+        else:
+            # Last match in row-major order, as a full floor scan gives
+            x,y = max(found,key=lambda pt:(pt[1],pt[0]))
+        return (x,y,z)
+
+    def palette_index(self,color):
+        """ Returns the palette index for color, adding it if needed """
+        key = tuple(color) if isinstance(color,list) else color
+        try:
+            return self.palette_keys[key]
+        except KeyError:
+            pass
+
+        if len(self.palette)>=WorldGrid.max_palette:
+            raise ValueError('Palette full, cannot add {}'.format(color))
+
+        self.palette_keys[key] = len(self.palette)
+        self.palette.append(key)
+        return self.palette_keys[key]
+
+    def unpack_color(self,idx):
+        color = self.palette[idx]
+        return list(color) if isinstance(color,tuple) else color
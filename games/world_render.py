@@ -0,0 +1,133 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+import sys
+from pokeyworks import ColorIze as color
+from tiles import WorldTile
+
+class WorldRenderer(object):
+
+    """ Renders WorldGrid floors as ANSI text, fully or incrementally """
+
+    # Every tile is drawn as a two column cell : '. ' for walls, '.'
+    # plus the (colorized) tile value otherwise.  The text of each
+    # (tile,palette index) pair is built once and reused, rows are
+    # assembled with a single join.
+    #
+    # update() redraws only the cells that changed since the previous
+    # redraw()/update() of that floor, using cursor positioning, so a
+    # live view costs output proportional to what changed.
+
+    cell_width = 2
+
+    def __init__(self,grid,out=None,origin=(1,1)):
+        self.grid = grid
+        self.out = out if out is not None else sys.stdout
+        self.origin = origin        # Terminal (row,col) of tile 0,0
+        self.cells = [None]*65536   # (tile<<8|palette) -> cell text
+        self.frames = {}            # z -> (tiles,colors) last drawn
+
+    def cell(self,code,pidx):
+        """ Returns the text for tile code drawn with palette index pidx """
+        key = code<<8|pidx
+        text = self.cells[key]
+        if text is None:
+            tile = chr(code)
+            if tile==WorldTile.wall:
+                text = '. '
+            elif pidx:
+                text = '.'+color(tile,self.grid.unpack_color(pidx)).colorized
+            else:
+                text = '.'+tile
+            self.cells[key] = text
+        return text
+
+    def render_row(self,y,z):
+        start = self.grid.offset((0,y,z))
+        end = start+self.grid.dim_x
+        cell = self.cell
+        return ''.join([
+                    cell(code,pidx) for code,pidx in zip(
+                                            self.grid.tiles[start:end],
+                                            self.grid.colors[start:end]
+                                            )
+                    ])
+
+    def render_floor(self,z):
+        """ Returns floor z as a list of row strings """
+        return [self.render_row(y,z) for y in range(self.grid.dim_y)]
+
+    def render(self,floors=None):
+        """ Returns the given floors (default: all) as one string """
+        if floors is None:
+            floors = range(self.grid.base_z,self.grid.base_z+self.grid.floors)
+
+        parts = []
+        for z in floors:
+            parts.append('\tFloor -{0}-\n'.format(z))
+            for row in self.render_floor(z):
+                parts.append(row)
+                parts.append('\n')
+        return ''.join(parts)
+
+    def snapshot(self,z):
+        start = self.grid.offset((0,0,z))
+        end = start+self.grid.floor_size
+        return self.grid.tiles[start:end],self.grid.colors[start:end]
+
+    def move(self,x,y):
+        """ Returns the escape sequence placing the cursor on tile x,y """
+        return '\x1b[{};{}H'.format(
+                                self.origin[0]+y,
+                                self.origin[1]+x*WorldRenderer.cell_width
+                                )
+
+    def redraw(self,z):
+        """ Draws all of floor z at the origin """
+        rows = self.render_floor(z)
+        out = [self.move(0,y)+row for y,row in enumerate(rows)]
+        self.out.write(''.join(out))
+        self.out.flush()
+        self.frames[z] = self.snapshot(z)
+
+    def update(self,z):
+        """ Draws only the tiles of floor z changed since the last frame
+
+        Returns the number of tiles drawn.
+        """
+        if z not in self.frames:
+            self.redraw(z)
+            return self.grid.floor_size
+
+        old_tiles,old_colors = self.frames[z]
+        new_tiles,new_colors = self.snapshot(z)
+        dim_x = self.grid.dim_x
+
+        out = []
+        changed = 0
+        for y in range(self.grid.dim_y):
+            a = y*dim_x
+            b = a+dim_x
+
+            # Unchanged rows are skipped with one slice comparison
+            if old_tiles[a:b]==new_tiles[a:b] and \
+               old_colors[a:b]==new_colors[a:b]:
+                continue
+
+            last = None
+            for i in range(a,b):
+                if old_tiles[i]==new_tiles[i] and \
+                   old_colors[i]==new_colors[i]:
+                    continue
+                x = i-a
+                if last!=x-1:
+                    out.append(self.move(x,y))
+                out.append(self.cell(new_tiles[i],new_colors[i]))
+                last = x
+                changed += 1
+
+        if out:
+            self.out.write(''.join(out))
+            self.out.flush()
+        self.frames[z] = (new_tiles,new_colors)
+        return changed
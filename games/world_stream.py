@@ -0,0 +1,135 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import collections
+import cPickle as pickle
+from world_generator import WorldGenerator
+
+class StreamingWorld(object):
+
+    """ World whose floors are generated on first access """
+
+    # Wraps a lazy WorldGenerator.  The stairs are planned up front (and
+    # only as deep as requested), each floor is built into its own
+    # single-floor WorldGrid when first touched.  At most max_floors
+    # stay in memory; the least recently used floor is pickled to
+    # spill_dir when evicted and read back on its next access, so
+    # changes made during play survive eviction.  A floor's waypoints
+    # are kept and spilled with it, and the generator's history is
+    # cleared after every floor, so memory stays flat however many
+    # floors are visited.
+    #
+    # Floors built here match the same floors of an eagerly generated
+    # world with the same seed and parameters.
+
+    def __init__(
+                self,
+                max_floors=4,       # Floors held in memory
+                spill_dir=None,     # Eviction directory (None = temp dir)
+                app_logger=None,    # Optional passed logger
+                **params            # WorldGenerator keyword arguments
+                ):
+
+        self.gen = WorldGenerator(lazy=True,app_logger=app_logger,**params)
+        self.logger = self.gen.logger
+        self.max_floors = max(1,int(max_floors))
+
+        self.dim_x = self.gen.dim_x
+        self.dim_y = self.gen.dim_y
+        self.dim_z = self.gen.dim_z
+        self.start = self.gen.start
+
+        if spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='world_stream_')
+            self.own_spill = True
+        else:
+            self.spill_dir = spill_dir
+            self.own_spill = False
+            if not os.path.isdir(spill_dir):
+                os.makedirs(spill_dir)
+
+        self.floors = collections.OrderedDict()    # z -> WorldGrid, LRU
+        self.ways = {}          # z -> waypoints, for floors in memory
+        self.spilled = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def __getitem__(self,key):
+        return self.floor(key[2])[key]
+
+    def __setitem__(self,key,value):
+        self.floor(key[2])[key] = value
+
+    def __contains__(self,key):
+        return 0<=key[2]<=self.dim_z and key in self.floor(key[2])
+
+    def floor(self,z):
+        """ Returns floor z as a single-floor WorldGrid """
+
+        if not 0<=z<=self.dim_z:
+            raise KeyError(z)
+
+        try:
+            grid = self.floors.pop(z)
+        except KeyError:
+            if z in self.spilled:
+                grid,self.ways[z] = self.load(z)
+            else:
+                self.logger.debug('\tGenerating floor {}'.format(z))
+                grid = self.gen.generate_floor(z)
+                self.ways[z] = self.gen.floor_ways.pop(z)
+                self.gen.grid = None
+                del self.gen.history[:]
+
+        # Most recently used goes last
+        self.floors[z] = grid
+        while len(self.floors)>self.max_floors:
+            old_z,old_grid = self.floors.popitem(last=False)
+            self.spill(old_z,old_grid,self.ways.pop(old_z))
+
+        return grid
+
+    def find_path_ends(self,z):
+        """ Returns the endpoints for the given floor """
+        return self.gen.find_path_ends(z)
+
+    def waypoints(self,z):
+        """ Returns the waypoints of floor z, generating it if needed """
+        self.floor(z)
+        return self.ways[z]
+
+    def spill_path(self,z):
+        return os.path.join(self.spill_dir,'floor_{}.grid'.format(z))
+
+    def spill(self,z,grid,ways):
+        self.logger.debug('\tSpilling floor {}'.format(z))
+        with open(self.spill_path(z),'wb') as outfile:
+            pickle.dump((grid,ways),outfile,pickle.HIGHEST_PROTOCOL)
+        self.spilled.add(z)
+
+    def load(self,z):
+        """ Returns (grid,waypoints) of spilled floor z """
+        self.logger.debug('\tLoading spilled floor {}'.format(z))
+        with open(self.spill_path(z),'rb') as infile:
+            return pickle.load(infile)
+
+    def close(self):
+        """ Drops all floors, removes the spill directory if we made it """
+        self.floors.clear()
+        self.ways.clear()
+        if self.own_spill:
+            shutil.rmtree(self.spill_dir,ignore_errors=True)
+        else:
+            for z in self.spilled:
+                try:
+                    os.remove(self.spill_path(z))
+                except OSError:
+                    pass
+        self.spilled = set()